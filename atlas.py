@@ -44,11 +44,13 @@ Copyright
 2017 California Institute of Technology.
 """
 
-__version__ = '0.2.0'
+__version__ = '0.4.0'
 
 import os
 import sys
 import csv
+import json
+import hashlib
 import argparse
 from six import BytesIO
 import nibabel as nib
@@ -57,7 +59,9 @@ import pandas as pd
 import multiprocessing as mp
 import shutil
 from glob import glob
-from scipy.ndimage.morphology import binary_erosion
+from scipy.ndimage import find_objects
+from nifti_io import iload_images
+from surface_distance import distance_map, surface_distance_metrics, surface_voxels
 
 
 def main():
@@ -73,6 +77,8 @@ def main():
     parser.add_argument('-a','--atlasdir', help='Output atlas directory ["<labeldir>/atlas"]')
     parser.add_argument('-k','--key', help='ITK-SNAP label key text file ["<labeldir>/labels.txt"]')
     parser.add_argument('-l','--labels', required=False, type=parse_range, help='List of label indices to process (eg 1-5, 7-9, 12)')
+    parser.add_argument('-c','--clean', action='store_true', help='Ignore cached results and rebuild all metrics')
+    parser.add_argument('-t','--tolerance', type=float, default=1.0, help='Surface Dice tolerance in mm [1.0]')
 
     # Parse command line arguments
     args = parser.parse_args()
@@ -117,121 +123,217 @@ def main():
     # Load the label key as a data frame
     label_key = load_key(label_keyfile_save)
 
-    # Init grand lists
-    labels = []
-    vox_mm = []  # Voxel dimensions in mm
-    vox_ul = []  # Voxel volume in mm^3 (microliters)
-    affine_tx = []  # Nifti affine transform
-    obs_names = []  # Observer names/initials
-
     # Similarity metrics output files
     inter_metrics_csv = os.path.join(atlas_dir, 'inter_observer_metrics.csv')
     intra_metrics_csv = os.path.join(atlas_dir, 'intra_observer_metrics.csv')
 
-    # Loop over observer directories ("obs-*")
-    # Load labeled images and collect into a nested list
-    # (template within observer)
+    # Memory-mapped 5D label stack shared with the metric workers
+    # -> labels[observer][template][x][y][z]
+    labels_fname = os.path.join(atlas_dir, '.labels_stack.npy')
 
-    for obs_dir in sorted(glob(os.path.join(label_dir, "obs-*"))):
+    labels, obs_names, obs_ims, vox_mm, affine_tx, labels_present = load_label_stack(label_dir, labels_fname)
 
-        if os.path.isdir(obs_dir):
+    # The label stack is removed however the analysis ends
+    try:
 
-            obs_names.append(os.path.basename(obs_dir))
+        # Persistent result cache keyed by image content hash
+        cache_fname = os.path.join(atlas_dir, '.atlas_cache.json')
 
-            print('Loading label images from %s' % obs_dir)
+        if args.clean:
+            cache = new_cache(args.tolerance)
+        else:
+            cache = load_cache(cache_fname, args.tolerance)
 
-            # Init template label list for this observer
-            obs_labels = []
+        image_hashes = [[file_hash(im) for im in ims] for ims in obs_ims]
 
-            # Loop over all template label images
-            for im in sorted(glob(os.path.join(obs_dir, '*.nii.gz'))):
+        # Limited list of labels to process
+        if args.labels:
+            label_nos = args.labels
+        else:
+            label_nos = np.int32(labels_present)
+            label_nos = np.delete(label_nos, np.where(label_nos == 0))  # Remove background label
 
-                # Load label image and add to list
-                this_nii = nib.load(im)
-                obs_labels.append(this_nii.get_data())
+        # Remove labels not present in key
+        label_unknown = []
+        for ll, label_no in enumerate(label_nos):
+            if get_label_name(label_no, label_key) == 'Unknown':
+                print('* Label %d unknown - removing from list' % label_no)
+                label_unknown.append(ll)
+        label_nos = np.delete(label_nos, label_unknown)
 
-                # Save voxel dimensions, volume
-                d = np.array(this_nii.header.get_zooms())
-                vox_mm.append(d)
-                vox_ul.append(d.prod())
-                affine_tx.append(this_nii.get_affine())
+        # Report remaining labels
+        print('  Analyzing %d unique labels (excluding background)' % len(label_nos))
 
-            # Add observer labels to grand list
-            if len(obs_labels) > 0:
-                print("  Loaded %d label images" % len(obs_labels))
-                labels.append(obs_labels)
-            else:
-                print("* No label images detected - skipping")
+        # Construct and output label mean and variance maps
+        label_stats_maps(atlas_dir, labels, label_nos, affine_tx, obs_names)
+
+        # Similarity metrics between and within observers
+        print('')
+        print('Computing similarity metrics between and within observers')
+
+        n_obs, n_tmp = labels.shape[0:2]
+
+        # Per-label voxel counts and bounding boxes for every template image
+        # Recomputed (one pass per image) only for new or changed images
+        print('  Collecting label statistics')
+        image_stats = [[cached_label_stats(cache, image_hashes[obs][tmp], labels[obs, tmp], label_nos)
+                        for tmp in range(0, n_tmp)]
+                       for obs in range(0, n_obs)]
+
+        # Pair metrics computed or used in this run
+        pair_cache, pair_cache_new = cache['pairs'], {}
+
+        # One worker pool for the whole run
+        # Workers attach to the label stack once and receive only indices
+        n_workers = max(1, mp.cpu_count()-2)
+
+        with mp.Pool(n_workers, initializer=_init_worker, initargs=(labels_fname, vox_mm, args.tolerance)) as pool:
+
+            # Intra-observer metrics for all labels
+            intra_metrics_all = intra_observer_metrics(pool, label_nos, image_stats,
+                                                       image_hashes, pair_cache, pair_cache_new)
+
+            # Inter-observer metrics for all labels
+            inter_metrics_all = inter_observer_metrics(pool, label_nos, image_stats,
+                                                       image_hashes, pair_cache, pair_cache_new)
+
+    finally:
+
+        # Release the memory map before removing its file
+        del labels
+        os.remove(labels_fname)
+
+    # Save updated cache, dropping entries for images no longer present
+    # Pairs for labels not analyzed in this run are kept for later runs
+    hashes_used = set(h for obs_hashes in image_hashes for h in obs_hashes)
+    cache['images'] = {h: st for h, st in cache['images'].items() if h in hashes_used}
+    cache['pairs'] = {k: v for k, v in pair_cache.items() if pair_hashes(k) <= hashes_used}
+    cache['pairs'].update(pair_cache_new)
+    save_cache(cache_fname, cache)
+
+    # Write metrics to report directory as CSV
+    save_intra_metrics(intra_metrics_csv, intra_metrics_all, label_nos, label_key)
+    save_inter_metrics(inter_metrics_csv, inter_metrics_all, label_nos, label_key)
+
+    # Clean exit
+    sys.exit(0)
+
+
+def load_label_stack(label_dir, stack_fname):
+    """
+    Stream all observer template label images into a compact memory-mapped 5D stack
+
+    Image dimensions are checked from the headers before any image data is decoded.
+    Images are then decoded in parallel and written straight into their slots in the
+    stack, so peak memory is a few decoded images plus the pages of the stack in use.
+
+    Parameters
+    ----------
+    label_dir: string
+        Directory containing observer label subdirectories ("obs-*")
+    stack_fname: string
+        Output .npy filename for the memory-mapped label stack
+
+    Returns
+    -------
+    labels: 5D numpy memmap of uint8 or uint16 [obs][tmp][x][y][z]
+    obs_names: list of observer directory names
+    obs_ims: nobs x ntmp nested list of label image filenames
+    vox_mm: voxel dimensions in mm
+    affine_tx: Nifti affine transform of the first image
+    label_nos: sorted label numbers present in any image (including background)
+    """
 
-    # Voxel dimensions and volumes
-    vox_mm, vox_ul = np.array(vox_mm), np.array(vox_ul)
+    # Collect template image lists for each observer directory ("obs-*")
+    obs_names, obs_ims = [], []
+
+    for obs_dir in sorted(glob(os.path.join(label_dir, "obs-*"))):
+
+        if os.path.isdir(obs_dir):
+
+            ims = sorted(glob(os.path.join(obs_dir, '*.nii.gz')))
+
+            if len(ims) > 0:
+                print('Found %d label images in %s' % (len(ims), obs_dir))
+                obs_names.append(os.path.basename(obs_dir))
+                obs_ims.append(ims)
+            else:
+                print("* No label images detected in %s - skipping" % obs_dir)
 
-    if not vox_mm.any():
+    if not obs_ims:
         print("* No label images detected in %s - exiting" % label_dir)
         sys.exit(1)
 
-    # Check for any variation in dimensions across templates and observers
-    if any(np.nonzero(np.std(vox_mm, axis=1))):
+    n_obs, n_tmp = len(obs_ims), len(obs_ims[0])
+
+    if any(len(ims) != n_tmp for ims in obs_ims):
+        print('* Not all observers have the same number of template images - exiting')
+        sys.exit(1)
+
+    # Check image and voxel dimensions from headers only
+    hdrs = [nib.load(im).header for ims in obs_ims for im in ims]
+
+    dims = np.array([h.get_data_shape()[0:3] for h in hdrs])
+    vox_mm = np.array([h.get_zooms()[0:3] for h in hdrs])
+
+    if np.any(dims != dims[0]):
+        print('* Not all images have the same dimensions - exiting')
+        sys.exit(1)
+
+    if np.any(vox_mm != vox_mm[0]):
         print('* Not all images have the same voxel dimensions - exiting')
         sys.exit(1)
-    else:
-        # Use dimensions from first image
-        vox_mm = vox_mm[0]
-        vox_ul = vox_ul[0]
 
-    # Convert nested list to 5D numpy array
-    # -> labels[observer][template][x][y][z]
-    print('Preparing labels')
-    labels = np.array(labels)
+    # Use dimensions from first image
+    nx, ny, nz = [int(d) for d in dims[0]]
+    vox_mm = vox_mm[0]
 
-    # Limited list of labels to process
-    if args.labels:
-        label_nos = args.labels
+    # Compact label datatype
+    if all(h.get_data_dtype().kind in 'ui' and h.get_data_dtype().itemsize == 1 for h in hdrs):
+        dtype = np.uint8
     else:
-        label_nos = np.int32(np.unique(labels))
-        label_nos = np.delete(label_nos, np.where(label_nos == 0))  # Remove background label
+        dtype = np.uint16
 
-    # Remove labels not present in key
-    label_unknown = []
-    for ll, label_no in enumerate(label_nos):
-        if get_label_name(label_no, label_key) == 'Unknown':
-            print('* Label %d unknown - removing from list' % label_no)
-            label_unknown.append(ll)
-    label_nos = np.delete(label_nos, label_unknown)
+    labels = np.lib.format.open_memmap(stack_fname, mode='w+', dtype=dtype, shape=(n_obs, n_tmp, nx, ny, nz))
 
-    # Report remaining labels
-    print('  Analyzing %d unique labels (excluding background)' % len(label_nos))
+    try:
 
-    # Construct and output label mean and variance maps
-    label_stats_maps(atlas_dir, labels, label_nos, affine_tx[0], obs_names)
+        # Label numbers present in any image
+        present = np.zeros(np.iinfo(dtype).max + 1, dtype=bool)
 
-    # Similarity metrics between and within observers
-    print('')
-    print('Computing similarity metrics between and within observers')
+        # Decode images in parallel, in stack order
+        print('Loading %d label images' % (n_obs * n_tmp))
+        all_ims = [im for ims in obs_ims for im in ims]
 
-    intra_metrics_all = []
-    inter_metrics_all = []
+        for ic, (im, this_nii, x) in enumerate(iload_images(all_ims)):
 
-    # Loop over each unique label value
-    for label_no in label_nos:
+            oc, tc = divmod(ic, n_tmp)
 
-        print('Analyzing label index %d' % label_no)
+            if ic == 0:
+                affine_tx = this_nii.affine
 
-        # Current label mask
-        label_mask = (labels == label_no)
+            # Check label range before writing into the stack
+            if x.dtype.kind == 'f':
+                x = np.rint(x)
+            if x.min() < 0 or x.max() > np.iinfo(dtype).max:
+                print('* Label values in %s outside %s range - exiting' % (im, np.dtype(dtype).name))
+                sys.exit(1)
 
-        # Intra-observer metrics
-        intra_metrics_all.append(intra_observer_metrics(label_mask, vox_mm))
+            labels[oc, tc] = x
+            present |= np.bincount(labels[oc, tc].ravel(), minlength=present.size) > 0
 
-        # Inter-observer metrics
-        inter_metrics_all.append(inter_observer_metrics(label_mask, vox_mm))
+            del x
 
-    # Write metrics to report directory as CSV
-    save_intra_metrics(intra_metrics_csv, intra_metrics_all, label_nos, label_key)
-    save_inter_metrics(inter_metrics_csv, inter_metrics_all, label_nos, label_key)
+        labels.flush()
 
-    # Clean exit
-    sys.exit(0)
+    except BaseException:
+
+        # Remove a partially written stack on errors and exits
+        del labels
+        os.remove(stack_fname)
+        raise
+
+    return labels, obs_names, obs_ims, vox_mm, affine_tx, np.nonzero(present)[0]
 
 
 def label_stats_maps(atlas_dir, labels, label_nos, affine_tx, obs_names):
@@ -261,161 +363,285 @@ def label_stats_maps(atlas_dir, labels, label_nos, affine_tx, obs_names):
     # Get dimensions of label data
     n_obs, n_tmp, nx, ny, nz = labels.shape
 
-    # Number of unique labels
-    n = len(label_nos)
-
-    # Init the label means and variances over all templates
-    label_means = np.zeros([nx, ny, nz, n, n_obs])
-    label_vars = np.zeros([nx, ny, nz, n, n_obs])
+    # Label counts summed over all observers and templates
+    total_counts = np.zeros([nx, ny, nz, len(label_nos)], dtype=np.uint32)
 
     # Create independent prob atlases for each observer
     for oc, obs_name in enumerate(obs_names):
 
         print('  Observer %02d (%s)' % (oc, obs_name))
 
-        # Extract labels for current observer
-        labels_obs = labels[oc,:,:,:,:]
-
-        # Loop over each unique label value
-        for lc, label_no in enumerate(label_nos):
-
-            print('    Adding label %d' % label_no)
+        # Per-voxel label counts over all templates for this observer
+        counts = label_counts(labels[oc], label_nos)
+        total_counts += counts
 
-            # Label mask for all templates
-            mask = labels_obs == label_no
-
-            # Label mean and variance over all templates
-            label_means[:, :, :, lc, oc] = np.mean(mask, axis=0)
-            label_vars[:, :, :, lc, oc] = np.var(mask, axis=0)
+        # Label mean and variance over all templates
+        # Variance of a binary variable with mean p is p(1-p)
+        label_mean = counts.astype(np.float32) / n_tmp
+        label_var = label_mean * (1.0 - label_mean)
 
         # Save observer label mean to atlas dir
         print('    Saving observer label mean')
         obs_mean_fname = os.path.join(atlas_dir, 'obs-{0:02d}_label_mean.nii.gz'.format(oc))
-        obs_mean_nii = nib.Nifti1Image(label_means[:,:,:,:,oc], affine_tx)
+        obs_mean_nii = nib.Nifti1Image(label_mean, affine_tx)
         obs_mean_nii.to_filename(obs_mean_fname)
 
         # Save observer label variance to atlas dir
         print('    Saving observer label variance')
         obs_var_fname = os.path.join(atlas_dir, 'obs-{0:02d}_label_var.nii.gz'.format(oc))
-        obs_var_nii = nib.Nifti1Image(label_vars[:,:,:,:,oc], affine_tx)
+        obs_var_nii = nib.Nifti1Image(label_var, affine_tx)
         obs_var_nii.to_filename(obs_var_fname)
 
+        del counts, label_mean, label_var
+
     # Label means over all observers (aka probabilistic atlas)
+    # All observers label the same number of templates
     print('Computing global label means (probabilistic atlas)')
-    p = np.mean(label_means, axis=4)
+    p = total_counts.astype(np.float32) / (n_obs * n_tmp)
     prob_atlas_fname = os.path.join(atlas_dir, 'prob_atlas.nii.gz')
     prob_nii = nib.Nifti1Image(p, affine_tx)
     prob_nii.to_filename(prob_atlas_fname)
 
 
-def intra_observer_metrics(label_mask, vox_mm):
+def label_counts(label_ims, label_nos):
     """
-    Calculate within-observer Dice, Hausdorff and related metrics
+    Count occurrences of each label at every voxel over a set of label volumes
+
+    Each volume is visited once and adds a one-hot count for its label at every voxel,
+    so the cost is independent of the number of labels.
 
     Parameters
     ----------
-    label_mask: 5D numpy boolean array [observer][template][x][y][z]
-    vox_mm: voxel dimensions in mm
+    label_ims: 4D numpy integer array [tmp][x][y][z]
+    label_nos: list of label numbers
 
     Returns
     -------
-    intra_metrics: nobs x ntmp x ntmp nested list
+    counts: 4D numpy uint16 array [x][y][z][label]
     """
 
-    # Dimensions
-    nobs, ntmp, nx, ny, nz = label_mask.shape
+    n_ims, nx, ny, nz = label_ims.shape
+    n = len(label_nos)
 
-    # Init grand intra-observer metrics list
-    intra_metrics = []
+    # Lookup table from label number to count index (n for unlisted labels)
+    lut = np.full(max(np.max(label_nos), np.iinfo(label_ims.dtype).max) + 1, n, dtype=np.int64)
+    lut[np.asarray(label_nos)] = np.arange(n)
 
-    print('  Calculating intra-observer similarity metrics :', end='')
+    counts = np.zeros([nx * ny * nz, n], dtype=np.uint16)
 
-    for obs in range(0,nobs):
+    for x in label_ims:
 
-        print(' %d' % obs, end='')
+        idx = lut[x.ravel()]
+        vox = np.nonzero(idx < n)[0]
 
-        # Results list for current observer
-        obs_res = []
+        # Each voxel holds a single label, so there are no repeated indices
+        counts[vox, idx[vox]] += 1
 
-        for ta in range(0, ntmp):
+    return counts.reshape([nx, ny, nz, n])
 
-            mask_a = label_mask[obs, ta, :, :, :]
-            data_list = []
 
-            for tb in range(0, ntmp):
+def intra_observer_metrics(pool, label_nos, image_stats, image_hashes, pair_cache, pair_cache_new):
+    """
+    Calculate within-observer Dice, Hausdorff and related metrics
 
-                mask_b = label_mask[obs,tb,:,:,:]
-                data_list.append((mask_a, mask_b, vox_mm))
+    Parameters
+    ----------
+    pool: multiprocessing pool initialized with _init_worker
+    label_nos: label numbers to analyze
+    image_stats: nobs x ntmp nested list of per-label statistics from label_stats()
+    image_hashes: nobs x ntmp nested list of image content hashes
+    pair_cache: cached pair metrics from previous runs
+    pair_cache_new: pair metrics used in this run (updated)
 
-            # Run similarity metric function in parallel on template A data list
-            with mp.Pool(mp.cpu_count()-2) as pool:
-                res = pool.starmap(similarity, data_list)
+    Returns
+    -------
+    intra_metrics: nlabels x nobs x ntmp x ntmp nested list
+    """
 
-            # Add to current observer results
-            obs_res.append(res)
+    print('  Calculating intra-observer similarity metrics')
 
-        # Add observer results to grand list
-        intra_metrics.append(obs_res)
+    nobs, ntmp = len(image_stats), len(image_stats[0])
 
-    print()
+    # Compare all templates within each observer
+    groups = [[(obs, tmp) for tmp in range(0, ntmp)] for obs in range(0, nobs)]
 
-    return intra_metrics
+    # -> [label][observer][tmpA][tmpB]
+    return group_metrics(pool, label_nos, groups, image_stats, image_hashes, pair_cache, pair_cache_new)
 
 
-def inter_observer_metrics(label_mask, vox_mm):
+def inter_observer_metrics(pool, label_nos, image_stats, image_hashes, pair_cache, pair_cache_new):
     """
      Calculate between-observer Dice, Hausdorff and related metrics
 
      Parameters
      ----------
-     label_mask: 5D numpy boolean array [observer][template][x][y][z]
-     vox_mm: voxel dimensions in mm
+     pool: multiprocessing pool initialized with _init_worker
+     label_nos: label numbers to analyze
+     image_stats: nobs x ntmp nested list of per-label statistics from label_stats()
+     image_hashes: nobs x ntmp nested list of image content hashes
+     pair_cache: cached pair metrics from previous runs
+     pair_cache_new: pair metrics used in this run (updated)
 
      Returns
      -------
-     inter_metrics: ntmp x nobs x nobs nested list
+     inter_metrics: nlabels x ntmp x nobs x nobs nested list
      """
 
-    # Dimensions
-    nobs, ntmp, nx, ny, nz = label_mask.shape
+    print('  Calculating inter-observer similarity metrics')
+
+    nobs, ntmp = len(image_stats), len(image_stats[0])
+
+    # Compare all observers within each template
+    groups = [[(obs, tmp) for obs in range(0, nobs)] for tmp in range(0, ntmp)]
+
+    # -> [label][template][obsA][obsB]
+    return group_metrics(pool, label_nos, groups, image_stats, image_hashes, pair_cache, pair_cache_new)
+
+
+def group_metrics(pool, label_nos, groups, image_stats, image_hashes, pair_cache, pair_cache_new):
+    """
+    Pairwise similarity metrics for each label within groups of images
+
+    Diagonal entries follow from the label voxel counts and pairs found in the cache
+    are reused. The remaining unique pairs of each label and group are computed in
+    one pool task cropped to the union bounding box of the label over the group.
+
+    Parameters
+    ----------
+    pool: multiprocessing pool initialized with _init_worker
+    label_nos: label numbers to analyze
+    groups: list of lists of (observer, template) indices to compare
+    image_stats: nobs x ntmp nested list of per-label statistics from label_stats()
+    image_hashes: nobs x ntmp nested list of image content hashes
+    pair_cache: cached pair metrics from previous runs
+    pair_cache_new: pair metrics used in this run (updated)
+
+    Returns
+    -------
+    metrics: nlabels x ngroups x n x n nested list of pair_similarity() tuples
+    """
+
+    metrics = []
+    tasks, task_slots = [], []
+    n_cached = 0
 
-    # Init grand inter-observer metrics list
-    inter_metrics = []
+    for label_no in label_nos:
 
-    print('  Calculating inter-observer similarity metrics :', end='')
+        label_metrics = []
 
-    for tmp in range(0, ntmp):
+        for images in groups:
 
-        print(' %d' % tmp, end='')
+            n = len(images)
+            stats = [image_stats[obs][tmp][label_no] for obs, tmp in images]
+            hashes = [image_hashes[obs][tmp] for obs, tmp in images]
 
-        # Results list for this template
-        tmp_res = []
+            m = [[None] * n for _ in range(n)]
+            todo = []
 
-        for obs_a in range(0, nobs):
+            for a in range(0, n):
 
-            mask_a = label_mask[obs_a, tmp, :, :, :]
+                # Identical masks
+                na = stats[a][0]
+                if na > 0:
+                    m[a][a] = (1.0, 0.0, na, na, 0.0, 0.0, 1.0)
+                else:
+                    m[a][a] = (np.nan, np.nan, na, na, np.nan, np.nan, np.nan)
 
-            data_list = []
+                for b in range(a + 1, n):
 
-            for obs_b in range(0, nobs):
+                    key, swap = pair_key(label_no, hashes[a], hashes[b])
 
-                mask_b = label_mask[obs_b, tmp, :, :, :]
+                    if key in pair_cache:
+                        res = pair_cache[key]
+                        pair_cache_new[key] = res
+                        n_cached += 1
+                        fill_pair(m, a, b, swap_pair(res) if swap else res)
+                    else:
+                        todo.append((a, b))
 
-                data_list.append((mask_a, mask_b, vox_mm))
+            if todo:
+                bb = union_box([st[1] for st in stats])
+                tasks.append((images, label_no, bb, todo))
+                task_slots.append((m, hashes, label_no))
 
-            # Run similarity metric function in parallel on data list
-            with mp.Pool(mp.cpu_count()-2) as pool:
-                res = pool.starmap(similarity, data_list)
+            label_metrics.append(m)
 
-            # Add to current template results
-            tmp_res.append(res)
+        metrics.append(label_metrics)
 
-        # Add template results to grand list
-        inter_metrics.append(tmp_res)
+    print('    %d pair metrics from cache, %d groups to compute' % (n_cached, len(tasks)))
 
-    print()
+    # Compute missing pairs in parallel and add to cache
+    for (m, hashes, label_no), task, res in zip(task_slots, tasks, pool.starmap(_group_similarity, tasks)):
+
+        for (a, b), r in zip(task[3], res):
+
+            r = (float(r[0]), float(r[1]), int(r[2]), int(r[3])) + tuple(float(v) for v in r[4:])
+            fill_pair(m, a, b, r)
+
+            key, swap = pair_key(label_no, hashes[a], hashes[b])
+            pair_cache_new[key] = swap_pair(r) if swap else r
+
+    return metrics
+
+
+def fill_pair(m, a, b, res):
+    """
+    Fill symmetric entries (a, b) and (b, a) of a pair metrics matrix
+    """
+
+    m[a][b] = tuple(res)
+    m[b][a] = swap_pair(res)
+
+
+def swap_pair(res):
+    """
+    Swap A and B in a pair_similarity() tuple
+    """
+
+    res = list(res)
+    res[2], res[3] = res[3], res[2]
+
+    return tuple(res)
+
+
+def _init_worker(labels_fname, vox_mm, tol_mm):
+    """
+    Attach a metrics worker to the memory-mapped 5D label stack
+
+    Parameters
+    ----------
+    labels_fname: .npy file containing labels[observer][template][x][y][z]
+    vox_mm: voxel dimensions in mm
+    tol_mm: surface Dice tolerance in mm
+    """
+
+    global _labels, _vox_mm, _tol_mm
+
+    _labels = np.load(labels_fname, mmap_mode='r')
+    _vox_mm = vox_mm
+    _tol_mm = tol_mm
+
+
+def _group_similarity(images, label_no, bb, pairs):
+    """
+    Pairwise similarity metrics for one label between images in the shared label stack
+
+    Parameters
+    ----------
+    images: list of (observer, template) indices into the label stack
+    label_no: label number
+    bb: bounding box enclosing the label in all images (see union_box)
+    pairs: list of (a, b) index pairs into images
 
-    return inter_metrics
+    Returns
+    -------
+    metrics: list of pair_similarity() tuples for each pair
+    """
+
+    # Only the cropped box is read from the label stack
+    masks = [extract_box(_labels[obs, tmp], bb) == label_no for obs, tmp in images]
+
+    return pair_similarity(masks, pairs, _vox_mm, _tol_mm)
 
 
 def save_intra_metrics(fname, intra_metrics, label_nos, label_key):
@@ -441,7 +667,7 @@ def save_intra_metrics(fname, intra_metrics, label_nos, label_key):
         writer = csv.writer(f)
 
         # Column headers
-        writer.writerow(('labelName','labelNo','observer','tmpA','tmpB','dice','hausdorff','nA','nB'))
+        writer.writerow(('labelName','labelNo','observer','tmpA','tmpB','dice','hausdorff','nA','nB','hd95','assd','surfDice'))
 
         for idx, m_idx in enumerate(intra_metrics):
             label_no = label_nos[idx]
@@ -474,7 +700,7 @@ def save_inter_metrics(fname, inter_metrics, label_nos, label_key):
         writer = csv.writer(f)
 
         # Column headers
-        writer.writerow(('labelName','labelNo','template','obsA','obsB','dice','hausdorff','nA','nB'))
+        writer.writerow(('labelName','labelNo','template','obsA','obsB','dice','hausdorff','nA','nB','hd95','assd','surfDice'))
 
         for idx, m_idx in enumerate(inter_metrics):
             label_no = label_nos[idx]
@@ -485,133 +711,291 @@ def save_inter_metrics(fname, inter_metrics, label_nos, label_key):
                         writer.writerow((label_name, label_no, tmp, obsA, obsB) + m_ob)
 
 
-def similarity(mask_a, mask_b, vox_mm):
+def pair_similarity(masks, pairs, vox_mm, tol_mm=1.0):
     """
+    Similarity metrics for a list of mask pairs, reusing per-mask results between pairs
+
+    The voxel count, surface and surface distance map of each mask are computed once
+    and reused for every pair it appears in. All surface distance metrics for a pair
+    come from the same two distance maps. The metrics are symmetric, so callers only
+    need to request each unique pair once.
 
     Parameters
     ----------
-    mask_a: 3D logical array
-    mask_b: 3D logical array
+    masks: list of 3D logical arrays
+    pairs: list of (a, b) index pairs into masks
     vox_mm: tuple of voxel dimensions in mm
+    tol_mm: surface Dice tolerance in mm
 
     Returns
     -------
-    dice, haus: similarity metrics
-    na, nb: number of voxels in each mask
+    metrics: list of (dice, haus, na, nb, hd95, assd, sdice) tuples for each pair
     """
 
-    # Count voxels in each mask
-    na, nb = np.sum(mask_a), np.sum(mask_b)
+    counts, surfs, dists = {}, {}, {}
 
-    # Only calculate stats if labels present in A or B
-    if na > 0 or nb > 0:
+    # Per-mask voxel counts, surfaces and surface distance maps
+    for i in set(i for pair in pairs for i in pair):
+        counts[i] = np.sum(masks[i])
+        surfs[i] = surface_voxels(masks[i])
+        dists[i] = distance_map(surfs[i], vox_mm) if counts[i] > 0 else None
 
-        # Find intersection and union of A and B masks
-        a_and_b = np.logical_and(mask_a, mask_b)
-        a_or_b = np.logical_or(mask_a, mask_b)
+    metrics = []
 
-        # Count voxels in intersection and union
-        n_a_and_b, n_a_or_b = np.sum(a_and_b), np.sum(a_or_b)
+    for a, b in pairs:
 
-        # Similarity metrics
-        dice = 2.0 * n_a_and_b / float(na + nb)
-        haus = hausdorff_distance(mask_a, mask_b, vox_mm)
-    else:
-        dice, haus = np.nan, np.nan
+        na, nb = counts[a], counts[b]
+
+        # Only calculate stats if labels present in A or B
+        if na > 0 or nb > 0:
+
+            n_a_and_b = np.sum(np.logical_and(masks[a], masks[b]))
+            dice = 2.0 * n_a_and_b / float(na + nb)
+
+            if dists[a] is not None and dists[b] is not None:
+                haus, hd95, assd, sdice = surface_distance_metrics(surfs[a], dists[a], surfs[b], dists[b], tol_mm)
+            else:
+                haus, hd95, assd, sdice = np.nan, np.nan, np.nan, np.nan
+
+        else:
+            dice, haus, hd95, assd, sdice = np.nan, np.nan, np.nan, np.nan, np.nan
+
+        metrics.append((dice, haus, na, nb, hd95, assd, sdice))
+
+    return metrics
 
-    return dice, haus, na, nb
+
+def label_bounding_boxes(x, label_nos):
+    """
+    Bounding boxes of all labels in a 3D integer label volume in a single pass
+
+    Parameters
+    ----------
+    x: 3D numpy integer array
+    label_nos: list of label numbers
+
+    Returns
+    -------
+    bbs: list of (xmin, xmax, ymin, ymax, zmin, zmax) bounding boxes with exclusive upper limits,
+        suitable for extract_box, for each label number. None if label absent
+    """
+
+    x = np.asarray(x, dtype=np.int64)
+
+    # Slices for labels 1..max_label, None for missing labels
+    objs = find_objects(x, max_label=int(np.max(label_nos)))
+
+    bbs = []
+    for label_no in label_nos:
+        sl = objs[label_no - 1] if label_no > 0 else None
+        if sl is None:
+            bbs.append(None)
+        else:
+            bbs.append((sl[0].start, sl[0].stop, sl[1].start, sl[1].stop, sl[2].start, sl[2].stop))
+
+    return bbs
 
 
-def hausdorff_distance(A, B, vox_mm):
+def label_stats(x, label_nos):
     """
-    Calculate the Hausdorff distance in mm between two binary masks in 3D
+    Voxel count and bounding box of each label in a 3D integer label volume
 
     Parameters
     ----------
-    A : 3D numpy logical array
-        Binary mask A
-    B : 3D numpy logical array
-        Binary mask B
-    vox_mm : numpy float array
-        voxel dimensions in mm
+    x: 3D numpy integer array
+    label_nos: list of label numbers
 
     Returns
     -------
-    H : float
-        hausdorff_distance distance between labels
+    stats: dict of (count, bounding box) tuples keyed by label number (see label_bounding_boxes)
     """
 
-    # Only need to calculate distances for surface voxels in each mask
-    sA = surface_voxels(A)
-    sB = surface_voxels(B)
+    n = np.bincount(np.asarray(x, dtype=np.int64).ravel(), minlength=int(np.max(label_nos)) + 1)
+    bbs = label_bounding_boxes(x, label_nos)
 
-    # Create lists of all True points in both surface masks
-    xA, yA, zA = np.nonzero(sA)
-    xB, yB, zB = np.nonzero(sB)
+    return dict((int(label_no), (int(n[label_no]), bb)) for label_no, bb in zip(label_nos, bbs))
 
-    # Count elements in each point set
-    nA = xA.size
-    nB = xB.size
 
-    if nA > 0 and nB > 0:
+def union_box(bbs, pad=1):
+    """
+    Padded union of a list of bounding boxes
 
-        # Init min dr to -1 for all points in A
-        min_dr = -1.0 * np.ones([nA])
+    The one voxel default padding keeps single voxel erosion of the cropped masks
+    identical to erosion of the full volume. Lower limits are clipped at zero and
+    upper limits are clipped by slicing in extract_box.
 
-        for ac in range(0,nA):
+    Parameters
+    ----------
+    bbs: list of bounding boxes (see label_bounding_boxes), None entries ignored
+    pad: padding in voxels
 
-            dx = (xA[ac] - xB[:]) * vox_mm[0]
-            dy = (yA[ac] - yB[:]) * vox_mm[1]
-            dz = (zA[ac] - zB[:]) * vox_mm[2]
-            min_dr[ac] = np.min(np.sqrt(dx**2 + dy**2 + dz**2))
+    Returns
+    -------
+    bb: padded union bounding box, or a single voxel box if all entries are None
+    """
 
-        # Find maximum over A of the minimum distances A to B
-        H = np.max(min_dr)
+    bbs = [bb for bb in bbs if bb is not None]
 
-    else:
+    if not bbs:
+        return 0, 1, 0, 1, 0, 1
+
+    bbs = np.array(bbs)
+
+    lo = np.maximum(bbs[:, 0::2].min(axis=0) - pad, 0)
+    hi = bbs[:, 1::2].max(axis=0) + pad
+
+    return lo[0], hi[0], lo[1], hi[1], lo[2], hi[2]
+
+
+def extract_box(x, bb):
+
+    return x[bb[0]:bb[1],bb[2]:bb[3],bb[4]:bb[5]]
+
+
+def file_hash(fname):
+    """
+    SHA-1 hash of file contents
+
+    Parameters
+    ----------
+    fname: filename
 
-        H = np.nan
+    Returns
+    -------
+    hash: hexadecimal digest string
+    """
+
+    h = hashlib.sha1()
 
-    return H
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
 
+    return h.hexdigest()
 
-def surface_voxels(x):
+
+def pair_key(label_no, hash_a, hash_b):
     """
-    Isolate surface voxel in a boolean mask using single voxel erosion
+    Cache key for a label pair metric, independent of image order
 
     Parameters
     ----------
-    x: 3D numpy boolean array
+    label_no: label number
+    hash_a, hash_b: content hashes of images A and B
 
     Returns
     -------
+    key: cache key string
+    swap: True if cached metrics are stored in (B, A) order
+    """
+
+    swap = hash_b < hash_a
 
+    if swap:
+        hash_a, hash_b = hash_b, hash_a
+
+    return '%d:%s:%s' % (label_no, hash_a, hash_b), swap
+
+
+def pair_hashes(key):
+    """
+    Set of image content hashes in a pair cache key from pair_key()
     """
 
-    # Erode by one voxel
-    x_eroded = binary_erosion(x, structure=np.ones([3,3,3]), iterations=1)
+    return set(key.split(':')[1:3])
 
-    # Return logical XOR of mask and eroded mask = surface voxels
-    return np.logical_xor(x, x_eroded)
 
+def new_cache(tol_mm):
+    """
+    Empty result cache for a given surface Dice tolerance
+    """
 
-def bounding_box(x):
+    return {'version': __version__, 'tolerance': tol_mm, 'images': {}, 'pairs': {}}
 
-    # Projections onto x, y and z axes
-    px = np.any(x, axis=(1, 2))
-    py = np.any(x, axis=(0, 2))
-    pz = np.any(x, axis=(0, 1))
 
-    px_min, px_max = np.where(px)[0][[0, -1]]
-    py_min, py_max = np.where(py)[0][[0, -1]]
-    pz_min, pz_max = np.where(pz)[0][[0, -1]]
+def load_cache(fname, tol_mm):
+    """
+    Load the per-image and per-pair result cache from the atlas directory
 
-    return px_min, px_max, py_min, py_max, pz_min, pz_max
+    Parameters
+    ----------
+    fname: cache JSON filename
+    tol_mm: surface Dice tolerance in mm for this run
 
+    Returns
+    -------
+    cache: dict with per-image label statistics and per-pair metrics, empty if missing or stale
+    """
 
-def extract_box(x, bb):
+    if not os.path.isfile(fname):
+        return new_cache(tol_mm)
 
-    return x[bb[0]:bb[1],bb[2]:bb[3],bb[4]:bb[5]]
+    try:
+        with open(fname, 'r') as f:
+            cache = json.load(f)
+    except ValueError:
+        print('* Unreadable cache (%s) - rebuilding' % fname)
+        return new_cache(tol_mm)
+
+    if cache.get('version') != __version__:
+        print('* Cache from atlas.py %s - rebuilding' % cache.get('version'))
+        return new_cache(tol_mm)
+
+    # Pair metrics depend on the surface Dice tolerance
+    if cache.get('tolerance') != tol_mm:
+        print('* Surface Dice tolerance changed - recomputing pair metrics')
+        cache['tolerance'], cache['pairs'] = tol_mm, {}
+
+    # Restore integer label keys and tuples
+    for h, stats in cache['images'].items():
+        cache['images'][h] = dict((int(k), (v[0], tuple(v[1]) if v[1] else None)) for k, v in stats.items())
+
+    cache['pairs'] = dict((k, tuple(v)) for k, v in cache['pairs'].items())
+
+    print('Loaded cached results for %d images and %d pairs' % (len(cache['images']), len(cache['pairs'])))
+
+    return cache
+
+
+def save_cache(fname, cache):
+    """
+    Save the result cache to the atlas directory
+
+    Parameters
+    ----------
+    fname: cache JSON filename
+    cache: result cache dict
+    """
+
+    print('Saving result cache to %s' % fname)
+
+    with open(fname, 'w') as f:
+        json.dump(cache, f)
+
+
+def cached_label_stats(cache, image_hash, x, label_nos):
+    """
+    Per-label statistics for an image from the cache, computing them if missing
+
+    Parameters
+    ----------
+    cache: result cache dict (updated)
+    image_hash: content hash of the image
+    x: 3D numpy integer label volume
+    label_nos: list of label numbers
+
+    Returns
+    -------
+    stats: dict of (count, bounding box) tuples keyed by label number
+    """
+
+    stats = cache['images'].get(image_hash, {})
+
+    if not all(int(label_no) in stats for label_no in label_nos):
+        stats.update(label_stats(x, label_nos))
+        cache['images'][image_hash] = stats
+
+    return stats
 
 
 def get_template_ids(label_dir, obs):
@@ -657,14 +657,14 @@ def load_metrics(atlas_dir):
 
     #
     # Load intra-observer metrics
-    # Ignore number of voxels in each label (nA, nB) for now
+    # Ignore number of voxels in each label (nA, nB) and surface distance metrics for now
     #
 
     intra_csv = os.path.join(atlas_dir, 'intra_observer_metrics.csv')
     m = np.genfromtxt(intra_csv,
                       dtype=None,
                       names=['labelName', 'labelNo', 'observer', 'tmpA', 'tmpB', 'dice', 'haus', 'nA', 'nB'],
-                      delimiter=',', skip_header=1)
+                      usecols=range(9), delimiter=',', skip_header=1)
 
     # Find unique label numbers with initial row indices for each
     label_nos, idx = np.unique(m['labelNo'], return_index=True)
@@ -688,7 +688,7 @@ def load_metrics(atlas_dir):
 
     #
     # Load inter-observer metrics
-    # Ignore number of voxels in each label (nA, nB) for now
+    # Ignore number of voxels in each label (nA, nB) and surface distance metrics for now
     #
 
     inter_csv = os.path.join(atlas_dir, 'inter_observer_metrics.csv')
@@ -697,7 +697,7 @@ def load_metrics(atlas_dir):
                              ('template', 'u8'), ('obsA', 'u8'), ('obsB', 'u8'),
                              ('dice', 'f8'), ('haus', 'f8'),
                              ('nA', 'u8'), ('nB', 'u8')],
-                      delimiter=',', skip_header=1)
+                      usecols=range(9), delimiter=',', skip_header=1)
 
     # Find unique label numbers with initial row indices for each
     label_nos, idx = np.unique(m['labelNo'], return_index=True)
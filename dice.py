@@ -44,6 +44,7 @@ import argparse
 import nibabel as nib
 import numpy as np
 import pandas as pd
+from surface_distance import hausdorff_distance
 
 
 def main():
@@ -54,6 +55,7 @@ def main():
     parser.add_argument('-b','--labelsB', required=True, help='Labeled volume B')
     parser.add_argument('-k','--labelsKey', required=False, help='ITK-SNAP label key [optional]')
     parser.add_argument('-l','--labelsList', required=False, type=parse_range, help='List of label indices to process (eg 1-5, 7-9, 12)')
+    parser.add_argument('-n','--nohausdorff', action='store_true', help='Skip Hausdorff distances (single pass over the volumes)')
 
     # Parse command line arguments
     args = parser.parse_args()
@@ -63,7 +65,7 @@ def main():
 
     # Load labeled volumes
     A_nii, B_nii = nib.load(labelsA), nib.load(labelsB)
-    A_labels, B_labels = A_nii.get_data(), B_nii.get_data()
+    A_labels, B_labels = np.asanyarray(A_nii.dataobj), np.asanyarray(B_nii.dataobj)
 
     # Load and parse label key if provided
     if args.labelsKey:
@@ -71,11 +73,17 @@ def main():
     else:
         label_key = []
 
+    # Joint label histogram of A and B in a single pass
+    label_nos, C = label_confusion(A_labels, B_labels)
+
+    # Voxel counts for each label in A and B (histogram marginals)
+    nA_all, nB_all = C.sum(axis=1), C.sum(axis=0)
+
     # Limited list of labels to process
     if args.labelsList:
         unique_labels = args.labelsList
     else:
-        unique_labels = np.unique(A_labels)
+        unique_labels = label_nos[nA_all > 0]
 
     # Voxel dimensions in mm (assume A and B have identical dimensions)
     vox_mm = np.array(A_nii.header.get_zooms())
@@ -99,33 +107,34 @@ def main():
             else:
                 label_name = 'Unknown'
 
-            # Create label mask from A and B volumes
-            A_mask = (A_labels == label_idx)
-            B_mask = (B_labels == label_idx)
+            # Row/column of this label in the joint histogram
+            lc = np.searchsorted(label_nos, label_idx)
+            if lc >= len(label_nos) or label_nos[lc] != label_idx:
+                continue
 
             # Count voxels in each mask
-            nA, nB = np.sum(A_mask), np.sum(B_mask)
+            nA, nB = nA_all[lc], nB_all[lc]
 
             # Only calculate stats if labels present in A or B
             if nA > 0 or nB > 0:
 
-                # Find intersection and union of A and B masks
-                AandB = np.logical_and(A_mask, B_mask)
-                AorB = np.logical_or(A_mask, B_mask)
-
                 # Count voxels in intersection and union
-                nAandB, nAorB = np.sum(AandB), np.sum(AorB)
+                nAandB = C[lc, lc]
+                nAorB = nA + nB - nAandB
 
                 # Similarity coefficients
                 Jaccard = nAandB / float(nAorB)
                 Dice = 2.0 * nAandB / float(nA + nB)
 
-                # hausdorff_distance distance
-                H = hausdorff_distance(A_mask, B_mask, vox_mm)
+                # Symmetric Hausdorff distance over all voxels in each mask
+                if args.nohausdorff:
+                    H = np.nan
+                else:
+                    H = hausdorff_distance(A_labels == label_idx, B_labels == label_idx, vox_mm, surface=False)
 
                 # Absolute volumes of label in A and B
-                A_vol_ul = np.sum(A_mask) * atlas_vox_vol_ul
-                B_vol_ul = np.sum(B_mask) * atlas_vox_vol_ul
+                A_vol_ul = nA * atlas_vox_vol_ul
+                B_vol_ul = nB * atlas_vox_vol_ul
 
                 if Dice < 0.001:
                     label_str = '>>> %20s' % label_name
@@ -139,53 +148,49 @@ def main():
     sys.exit(0)
 
 
-def hausdorff_distance(A, B, vox_mm):
+def label_confusion(A_labels, B_labels):
     """
-    Calculate the hausdorff_distance distance in mm between two binary masks in 3D
+    Joint label histogram (confusion matrix) of two label volumes in one bincount pass
 
     Parameters
     ----------
-    A : 3D numpy array
-        Binary mask A
-    B : 3D numpy array
-        Binary mask B
-    vox_mm : numpy array
-        voxel dimensions in mm
+    A_labels : numpy integer array
+        Label volume A
+    B_labels : numpy integer array
+        Label volume B with the same shape as A
 
     Returns
     -------
-    H : float
-        hausdorff_distance distance between labels
+    label_nos : numpy integer array
+        Sorted label numbers present in A or B
+    C : 2D numpy integer array
+        C[i, j] = number of voxels labeled label_nos[i] in A and label_nos[j] in B
     """
 
-    # Create lists of all True points in both masks
-    xA, yA, zA = np.nonzero(A)
-    xB, yB, zB = np.nonzero(B)
-
-    # Count elements in each point set
-    nA = xA.size
-    nB = xB.size
+    # Integer label codes (labels may be stored as floats)
+    A = np.rint(A_labels).astype(np.int64).ravel()
+    B = np.rint(B_labels).astype(np.int64).ravel()
 
-    if nA > 0 and nB > 0:
+    # Offset allows for negative label numbers
+    lut_offset = min(A.min(), B.min(), 0)
+    A = A - lut_offset
+    B = B - lut_offset
 
-        # Init min dr to -1 for all points in A
-        min_dr = -1.0 * np.ones([nA])
+    # Labels present in either volume
+    n_max = max(A.max(), B.max()) + 1
+    present = (np.bincount(A, minlength=n_max) > 0) | (np.bincount(B, minlength=n_max) > 0)
+    codes = np.nonzero(present)[0]
+    label_nos = codes + lut_offset
+    n = len(label_nos)
 
-        for ac in range(0,nA):
-
-            dx = (xA[ac] - xB[:]) * vox_mm[0]
-            dy = (yA[ac] - yB[:]) * vox_mm[1]
-            dz = (zA[ac] - zB[:]) * vox_mm[2]
-            min_dr[ac] = np.min(np.sqrt(dx**2 + dy**2 + dz**2))
-
-        # Find maximum over A of the minimum distances A to B
-        H = np.max(min_dr)
-
-    else:
+    # Lookup table from label number to compact histogram index
+    lut = np.zeros(n_max, dtype=np.int64)
+    lut[codes] = np.arange(n)
 
-        H = np.nan
+    # Paired label codes for every voxel -> joint histogram
+    C = np.bincount(lut[A] * n + lut[B], minlength=n * n).reshape(n, n)
 
-    return H
+    return label_nos, C
 
 
 def load_key(key_fname):
@@ -50,7 +50,7 @@ import argparse
 import nibabel as nib
 import numpy as np
 import random
-from scipy.interpolate import Rbf
+from scipy.interpolate import Rbf, RBFInterpolator
 from scipy.signal import medfilt
 from scipy.ndimage.morphology import distance_transform_edt as EDT
 from scipy.ndimage.morphology import binary_erosion, binary_dilation
@@ -62,6 +62,14 @@ def main():
     parser = argparse.ArgumentParser(description='Interpolate labels')
     parser.add_argument('-i','--input', required=True, help="Labeled volume")
     parser.add_argument('-l','--labels', help="Label numbers to interpolate, separated by comma")
+    parser.add_argument('-m','--method', choices=['sdf', 'rbf', 'local'], default='sdf',
+                        help="Interpolation engine: signed distance, global RBF or neighbor-limited local RBF [sdf]")
+    parser.add_argument('-k','--neighbors', type=int, default=64,
+                        help="Nearest nodes used for each voxel by the local RBF engine [64]")
+    parser.add_argument('-n','--max-nodes', type=int, default=5000,
+                        help="Maximum number of RBF nodes per label, 0 for no limit [5000]")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed for RBF node sampling [0]")
 
     # Parse command line arguments
     args = parser.parse_args()
@@ -77,10 +85,13 @@ def main():
 
     # Load labeled volume
     label_nii = nib.load(label_fname)
-    labels = label_nii.get_data()
+    labels = np.asanyarray(label_nii.dataobj)
     
     # Size of image space
     nx, ny, nz = labels.shape
+
+    # Voxel dimensions in mm
+    vox_mm = np.array(label_nii.header.get_zooms()[0:3])
     
     # Destination label volume
     new_labels = labels.copy()
@@ -126,12 +137,23 @@ def main():
             # Only interpolate if slice-like features found
             if nSx > 1 or nSy > 1 or nSz > 1:
             
-                # Construct point value lists over all slices
-                nodes, vals = NodeValues(Lsub, slices)
-                
-                # RBF Interpolate values within subvolume
-                # Returns thresholded integer volume
-                Lsubi = RBFInterpolate(Lsub, nodes, vals)
+                if args.method == 'sdf':
+
+                    # Shape-based interpolation between slices
+                    # Returns thresholded integer volume
+                    Lsubi = SDFInterpolate(Lsub, slices, vox_mm)
+
+                else:
+
+                    # Construct point value lists over all slices
+                    nodes, vals = NodeValues(Lsub, slices, max_nodes=args.max_nodes, seed=args.seed)
+
+                    # RBF Interpolate values within subvolume
+                    # Returns thresholded integer volume
+                    if args.method == 'local':
+                        Lsubi = LocalRBFInterpolate(Lsub, nodes, vals, neighbors=args.neighbors)
+                    else:
+                        Lsubi = RBFInterpolate(Lsub, nodes, vals)
                 
                 # Scale interpolation back to original label value
                 Lsubi *= label
@@ -146,7 +168,7 @@ def main():
     
     # Save interpolated label volume
     print('Saving interpolated labels to %s' % out_fname)
-    out_nii = nib.Nifti1Image(new_labels, label_nii.get_affine())
+    out_nii = nib.Nifti1Image(new_labels, label_nii.affine)
     out_nii.to_filename(out_fname)
         
     
@@ -228,81 +250,73 @@ def FindSlices(label):
     return Sx, Sy, Sz
     
     
-def NodeValues(vol, slices):
+def NodeValues(vol, slices, max_nodes=None, seed=0):
     '''
     Generate coordinate nodes and values for interpolation
     Extract values from x, y and z slices in volume
+
+    About a third of the boundary layer pixels in each slice are used as nodes.
+    If this exceeds max_nodes, the node count of each slice is scaled down in
+    proportion. Nodes within a slice are drawn by stratified sampling along the
+    boundary with a seeded generator, so repeated runs use identical nodes.
+
+    Arguments
+    ----
+    vol : 3D numpy array
+        Label subvolume
+    slices : tuple
+        Slice indices in each axis from FindSlices
+    max_nodes : int
+        Maximum number of nodes for this label [no limit]
+    seed : int
+        Random seed for node sampling
     '''
-    
-    # Init coordinate and value arrays
-    nodes = np.array([])
-    vals = np.array([])
 
-    # X, Y and Z slice lists
-    Sx, Sy, Sz = slices
-    
-    for x in Sx[0]:
-        
-        # Extract slice and remove singlet dimension
-        v_yz = vol[x,:,:].squeeze()
-        
-        # Inside-outside values and nodes from slice
-        io_yz, yz = InsideOutside(v_yz)
-
-        # Construct 3D coordinate list
-        n = yz.shape[0]
-        xyz = np.zeros([n, 3])
-        xyz[:,0] = x
-        xyz[:,1] = yz[:,0]
-        xyz[:,2] = yz[:,1]
-        
-        # Append the nodes and values
-        nodes = _safe_append(nodes, xyz)
-        vals = _safe_append(vals, io_yz)
-    
-    for y in Sy[0]:
-        
-        # Extract slice and remove singlet dimension
-        v_xz = vol[:,y,:].squeeze()
-        
-        # Inside-outside values and nodes from slice
-        io_xz, xz = InsideOutside(v_xz)
-        
-        # Construct 3D coordinate list
-        n = xz.shape[0]
-        xyz = np.zeros([n, 3])
-        xyz[:,0] = xz[:,0]
-        xyz[:,1] = y
-        xyz[:,2] = xz[:,1]
-        
-        # Append the nodes and values
-        nodes = _safe_append(nodes, xyz)
-        vals = _safe_append(vals, io_xz)
-        
-    for z in Sz[0]:
-        
-        # Extract slice and remove singlet dimension
-        v_xy = vol[:,:,z].squeeze()
-        
-        # Inside-outside values and nodes from slice
-        io_xy, xy = InsideOutside(v_xy)
-        
-        # Construct 3D coordinate list
-        n = xy.shape[0]
-        xyz = np.zeros([n, 3])
-        xyz[:,0] = xy[:,0]
-        xyz[:,1] = xy[:,1]
-        xyz[:,2] = z
-        
-        # Append the nodes and values
-        nodes = _safe_append(nodes, xyz)
-        vals = _safe_append(vals, io_xy)   
+    rng = np.random.default_rng(seed)
 
-        
-    # Remove duplicate locations
-    rr = _unique_rows(nodes)
-    nodes = nodes[rr,:]
-    vals = vals[rr]
+    # Boundary layer pixels and IO function values for every slice
+    cands = []
+    for axis in range(3):
+        for s in slices[axis][0]:
+
+            # Extract slice with slice axis removed
+            v = np.take(vol, s, axis=axis)
+
+            # Inside-outside values and nodes from slice
+            io_s, uv = InsideOutside(v)
+
+            cands.append((axis, s, io_s, uv))
+
+    # Every third point(ish) on boundary should be sufficient for accurate RBF
+    n_samp = np.array([int(c[2].size / 3.0) for c in cands], dtype=int)
+
+    # Scale node counts to fit within budget
+    if max_nodes and n_samp.sum() > max_nodes:
+        n_samp = np.floor(n_samp * (max_nodes / float(n_samp.sum()))).astype(int)
+
+    # Pre-allocate coordinate and value arrays
+    n_nodes = int(n_samp.sum())
+    nodes = np.zeros([n_nodes, 3])
+    vals = np.zeros(n_nodes)
+
+    n0 = 0
+    for (axis, s, io_s, uv), k in zip(cands, n_samp):
+
+        samp = _stratified_sample(io_s.size, k, rng)
+
+        # Insert slice coordinate into 2D node coordinates
+        xyz = nodes[n0:n0+k]
+        xyz[:, axis] = s
+        xyz[:, [a for a in range(3) if a != axis]] = uv[samp, :]
+        vals[n0:n0+k] = io_s[samp]
+
+        n0 += k
+
+    # Remove duplicate locations where slices in different axes intersect
+    _, ui = np.unique(nodes, axis=0, return_index=True)
+    ui = np.sort(ui)
+    nodes = nodes[ui,:]
+    vals = vals[ui]
     
     print('  Using %d unique nodes' % vals.size)
 
@@ -319,13 +333,11 @@ def InsideOutside(s):
     s : 2D numpy integer array
         Extracted slice of label volume
     '''
-    
-    nx, ny = s.shape
 
     # Create boundary layer mask from difference between dilation
     # and erosion of label. The mask represents the layers of
     # voxels immediately inside and outside the boundary.
-    bound_mask = binary_dilation(s) - binary_erosion(s)
+    bound_mask = binary_dilation(s) ^ binary_erosion(s)
     
     # Inside-outside function from complement Euclidian distance transforms
     # Positive outside, negative inside
@@ -334,15 +346,20 @@ def InsideOutside(s):
     # Extract x, y coordinates and IO function values boundary layers
     xy = np.argwhere(bound_mask) # N x 2 coordinates of non-zero voxels
     
-    # Random downsample by 3
-    # Every third point(ish) on boundary should be sufficient for accurate RBF
-    n = xy.shape[0]
-    samp = np.random.choice(np.arange(n), int(n/3.0))
-    xy = xy[samp,:]
-    
     io_xy = io[xy[:,0], xy[:,1]] 
     
     return io_xy, xy
+
+
+def _stratified_sample(n, k, rng):
+    '''
+    Draw k of n indices without replacement, one from each of k equal strata
+    '''
+
+    if k <= 0:
+        return np.zeros(0, dtype=int)
+
+    return np.floor((np.arange(k) + rng.random(k)) * (n / float(k))).astype(int)
     
     
 
@@ -373,35 +390,139 @@ def RBFInterpolate(vol, nodes, vals, function='multiquadric', smooth=0.5):
     
     return voli
 
-    
-def _safe_append(aa, bb, axis=0):
+
+def LocalRBFInterpolate(vol, nodes, vals, neighbors=64, kernel='thin_plate_spline', smooth=0.5, chunk=65536):
     '''
-    Append new_nodes to nodes along the given axis
-    Allow for nodes = [], in which case just new_nodes is returned
-    Remove and duplicate rows before returrning
+    Interpolate node values within the volume using a neighbor-limited radial basis function
+
+    Each voxel is interpolated from its nearest nodes only, so there is no dense
+    N x N solve over all boundary nodes. Voxels are evaluated in chunks to keep
+    memory bounded for large structures.
+
+    Arguments
+    ----
+    vol : 3D numpy array
+        Label subvolume defining the interpolation grid
+    nodes : N x 3 numpy array
+        Node coordinates
+    vals : numpy array
+        Inside-outside function values at nodes
+    neighbors : int
+        Number of nearest nodes used for each voxel
+    kernel : str
+        RBFInterpolator kernel
+    smooth : float
+        Smoothing parameter
+    chunk : int
+        Number of voxels evaluated at once
     '''
 
-    if not aa.any():
-        aabb = bb.copy()
-    else:
-        aabb = np.append(aa, bb, axis=axis)
-    
-    return aabb
+    # Construct local RBF interpolator from node values
+    print('  Constructing local interpolator')
+    print('    Kernel    : %s' % kernel)
+    print('    Neighbors : %d' % neighbors)
+    print('    Smoothing : %0.1f' % smooth)
+    rbf = RBFInterpolator(nodes, vals, neighbors=min(neighbors, vals.size), kernel=kernel, smoothing=smooth)
+
+    # Interpolation mesh for volume
+    nx, ny, nz = vol.shape
+    n = nx * ny * nz
+
+    print('  Interpolating subvolume over %d voxels' % n)
+
+    voli = np.zeros(n, dtype=int)
+
+    for c0 in range(0, n, chunk):
+
+        # Voxel coordinates for this chunk
+        xi = np.column_stack(np.unravel_index(np.arange(c0, min(c0 + chunk, n)), (nx, ny, nz)))
+
+        # IO function is zero on boundary, negative inside label
+        voli[c0:c0 + xi.shape[0]] = rbf(xi) < 0.0
+
+    return voli.reshape(nx, ny, nz)
 
     
-def _unique_rows(a):
+def SDFInterpolate(vol, slices, vox_mm=(1.0, 1.0, 1.0)):
     '''
-    Return logical mask of unique rows in 2D array
-    Based on best answer to http://stackoverflow.com/questions/8560440
+    Shape-based interpolation of signed distance maps between labeled slices
+
+    A 2D signed distance map is computed in mm on each labeled slice and
+    interpolated linearly between neighboring slices along the slice axis.
+    Where slices were found in more than one axis, the estimates are averaged.
+    Voxels outside the range of labeled slices in every axis are left unlabeled.
+    Cost scales with the number of voxels in the subvolume.
+
+    Arguments
+    ----
+    vol : 3D numpy array
+        Label subvolume
+    slices : tuple
+        Slice indices in each axis from FindSlices
+    vox_mm : array-like
+        Voxel dimensions in mm
     '''
-    order = np.lexsort(a.T)
-    a = a[order]
-    diff = np.diff(a, axis=0)
-    ui = np.ones(len(a), 'bool')
-    ui[1:] = (diff != 0).any(axis=1)
-    
-    return ui
-    
+
+    # Sum and count of distance estimates over slice axes
+    sdf_sum = np.zeros(vol.shape, dtype=np.float32)
+    n_est = np.zeros(vol.shape, dtype=np.uint8)
+
+    for axis in range(3):
+
+        S = np.sort(slices[axis][0])
+
+        # At least two slices needed to interpolate along this axis
+        if S.size < 2:
+            continue
+
+        print('  Interpolating %d signed distance maps along axis %d' % (S.size, axis))
+
+        # Views with the slice axis first
+        v = np.moveaxis(vol, axis, 0)
+        sv = np.moveaxis(sdf_sum, axis, 0)
+        nv = np.moveaxis(n_est, axis, 0)
+
+        # In-plane voxel dimensions
+        samp = [vox_mm[a] for a in range(3) if a != axis]
+
+        # Signed distance map on each slice, negative inside
+        D = np.empty((S.size,) + v.shape[1:], dtype=np.float32)
+        for k, s in enumerate(S):
+            D[k] = _signed_distance(v[s] > 0, samp)
+
+        # Linear interpolation between each pair of neighboring slices
+        for k in range(S.size - 1):
+            s0, s1 = S[k], S[k+1]
+            w = (np.arange(s0, s1, dtype=np.float32) - s0) / float(s1 - s0)
+            w = w[:, None, None]
+            sv[s0:s1] += (1.0 - w) * D[k] + w * D[k+1]
+            nv[s0:s1] += 1
+
+        # Last slice
+        sv[S[-1]] += D[-1]
+        nv[S[-1]] += 1
+
+    # Signed distance is negative inside label
+    voli = ((sdf_sum < 0.0) & (n_est > 0)).astype(int)
+
+    return voli
+
+
+def _signed_distance(m, samp):
+    '''
+    Signed Euclidean distance in mm from a 2D mask boundary, negative inside
+    The slice is padded with background so that labels reaching the edge of
+    the subvolume are bounded
+    '''
+
+    if not m.any():
+        return np.full(m.shape, np.sum(np.array(m.shape) * np.max(samp)))
+
+    m_pad = np.pad(m, 1)
+    d = EDT(~m_pad, sampling=samp) - EDT(m_pad, sampling=samp)
+
+    return d[1:-1, 1:-1]
+
 
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
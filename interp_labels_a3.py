@@ -53,47 +53,48 @@ import numpy as np
 from scipy.interpolate import Rbf
 from scipy.signal import medfilt
 from scipy.spatial import Delaunay
-from skimage import measure
 import time
+import multiprocessing as mp
 from scipy.ndimage.filters import gaussian_filter
+from scipy.ndimage import find_objects
 
 
 def ReduceSlices2Contours(Lsub, slices):
     """
     Detects contours of segmentation in a slices
+
+    For a binary label the 0.5 iso-contour passes through the midpoint of every
+    edge between an inside and an outside pixel, so the contour pixels are found
+    directly from pixel differences. All slices of an axis are processed at once.
     
     @param Lsub: Label Volume
     @type Lsub: 3D-np.array of e.g. NIFTI image
     @param slices: coordinates of slices in each axis direction
     @type slices: 3-Tupel
-    @return: Volume with Labels reduced to contours in same format as input, list of all detected contorus w/ x,y of points in each contour
-    @rtype: list
+    @return: Volume with Labels reduced to contours in same format as input
+    @rtype: 3D np.array
     """
-    new_Lsub = np.zeros_like(Lsub)
-    all_contours = []
+    new_Lsub = np.zeros(Lsub.shape, dtype=bool)
     for axis in range(3):
-        for i in slices[axis][0]:
-            if axis == 0:
-                myslice = Lsub[i,:,:]
-            elif axis == 1:
-                myslice = Lsub[:,i,:]
-            elif axis == 2:
-                myslice = Lsub[:,:,i]
-            contours = measure.find_contours(myslice, 0.5,fully_connected='high')
-            myslice = np.zeros_like(myslice)
-            for contour in contours:
-                all_contours.append(contour)
-                for p in range(len(contour)):
-                    x,y = contour[p]
-                    myslice[int(x), int(y)] = 1
-                if axis == 0:
-                    new_Lsub[i,:,:] += myslice
-                elif axis == 1:
-                    new_Lsub[:,i,:] += myslice
-                elif axis == 2:
-                    new_Lsub[:,:,i] += myslice
-    new_Lsub = (new_Lsub > 0.5).astype(int)
-    return(new_Lsub, all_contours)
+        S = slices[axis][0]
+        if len(S) < 1:
+            continue
+
+        # Stack of slices with the slice axis first
+        m = np.moveaxis(Lsub, axis, 0)[S] > 0.5
+        c = np.zeros_like(m)
+
+        # Contours are only traced in slices at least 2 x 2 pixels
+        if m.shape[1] > 1 and m.shape[2] > 1:
+
+            # Contour point on each crossing edge rounds down to the first pixel
+            c[:, :-1, :] |= m[:, :-1, :] != m[:, 1:, :]
+            c[:, :, :-1] |= m[:, :, :-1] != m[:, :, 1:]
+
+        np.moveaxis(new_Lsub, axis, 0)[S] |= c
+
+    new_Lsub = new_Lsub.astype(int)
+    return(new_Lsub)
 
 
 def EvalSliceDistance(slices):
@@ -132,26 +133,22 @@ def MakeSamplePoints(vol, slices, dist):
     """
     vol_s = np.zeros_like(vol)
     for axis in range(3):
-        for i in slices[axis][0]:
-            if axis == 0:
-                myslice = vol[i,:,:]
-            elif axis == 1:
-                myslice = vol[:,i,:]
-            elif axis == 2:
-                myslice = vol[:,:,i]
-            xs = np.arange(0, myslice.shape[0], dist)
-            ys = np.arange(0, myslice.shape[1], dist)
-            myslice_s = np.zeros_like(myslice)
-            for x in xs:
-                for y in ys: 
-                    myslice_s[x,y] = 1
-            myslice_s = (myslice + myslice_s) > 1
-            if axis == 0:
-                vol_s[i,:,:] = myslice_s
-            elif axis == 1:
-                vol_s[:,i,:] = myslice_s
-            elif axis == 2:
-                vol_s[:,:,i] = myslice_s
+        S = slices[axis][0]
+        if len(S) < 1:
+            continue
+
+        # Slices with the slice axis first
+        v = np.moveaxis(vol, axis, 0)
+
+        # Regular sampling grid, identical for all slices in this axis
+        xs = np.arange(0, v.shape[1], dist).astype(int)
+        ys = np.arange(0, v.shape[2], dist).astype(int)
+        grid = np.zeros(v.shape[1:], dtype=bool)
+        grid[np.ix_(xs, ys)] = True
+
+        # Grid points inside the label on all slices at once
+        np.moveaxis(vol_s, axis, 0)[S] = (v[S] > 0) & grid
+
     return(vol_s)
 
 
@@ -380,52 +377,77 @@ def _unique_rows(a):
 
 
 def alpha_shape(points, tri, alpha):
-    classification = np.zeros(tri.vertices.shape[0])
-
-    for i in range(tri.vertices.shape[0]):
-        pa = points[tri.vertices[i,0]]
-        pb = points[tri.vertices[i,1]]
-        pc = points[tri.vertices[i,2]]
-        pd = points[tri.vertices[i,3]]
-
-        # a = |x_1 y_1 z_1 1; x_2 y_2 z_2 1; x_3 y_3 z_3 1; x_4 y_4 z_4 1|
-        a = np.linalg.det(np.array([
-            [pa[0], pa[1], pa[2], 1],
-            [pb[0], pb[1], pb[2], 1],
-            [pc[0], pc[1], pc[2], 1],
-            [pd[0], pd[1], pd[2], 1]
-        ]))
-
-        # D=[x_1^2+y_1^2+z_1^2 x_1 y_1 z_1 1; x_2^2+y_2^2+z_2^2 x_2 y_2 z_2 1; x_3^2+y_3^2+z_3^2 x_3 y_3 z_3 1; x_4^2+y_4^2+z_4^2 x_4 y_4 z_4 1] 
-        D=np.array([[pow(pa[0],2)+pow(pa[1],2)+pow(pa[2],2), pa[0], pa[1], pa[2], 1],
-                    [pow(pb[0],2)+pow(pb[1],2)+pow(pb[2],2), pb[0], pb[1], pb[2], 1],
-                    [pow(pc[0],2)+pow(pc[1],2)+pow(pc[2],2), pc[0], pc[1], pc[2], 1],
-                    [pow(pd[0],2)+pow(pd[1],2)+pow(pd[2],2), pd[0], pd[1], pd[2], 1]
-                ])
-
-        D_x = np.linalg.det(D[:,[0,2,3,4]])
-        D_y = np.linalg.det(D[:,[0,1,3,4]]) * -1
-        D_z = np.linalg.det(D[:,[0,1,2,4]])
-
-        # c=|x_1^2+y_1^2+z_1^2 x_1 y_1 z_1; x_2^2+y_2^2+z_2^2 x_2 y_2 z_2; x_3^2+y_3^2+z_3^2 x_3 y_3 z_3; x_4^2+y_4^2+z_4^2 x_4 y_4 z_4|. 
-        c = np.linalg.det(np.array([
-            [pow(pa[0],2)+pow(pa[1],2)+pow(pa[2],2), pa[0], pa[1], pa[2]],
-            [pow(pb[0],2)+pow(pb[1],2)+pow(pb[2],2), pb[0], pb[1], pb[2]],
-            [pow(pc[0],2)+pow(pc[1],2)+pow(pc[2],2), pc[0], pc[1], pc[2]],
-            [pow(pd[0],2)+pow(pd[1],2)+pow(pd[2],2), pd[0], pd[1], pd[2]]
-        ]))
-
-        # circumsphere        
-        circum_r = np.sqrt(pow(D_x,2) + pow(D_y,2) + pow(D_z,2) - 4 * a * c) / (2 * abs(a))
- 
-        # Here's the radius filter.
-        #print circum_r
-        if circum_r < 1.0/alpha:
-            classification[i] = 1.0
+    """
+    Classify Delaunay tetrahedra as inside the alpha complex
+
+    Circumsphere radii of all tetrahedra are computed at once from vertex
+    coordinates relative to the first vertex of each tetrahedron. For integer
+    voxel coordinates the determinants are evaluated exactly in integer
+    arithmetic, so degenerate (flat) tetrahedra have an exactly zero volume
+    and an infinite circumradius.
+
+    @param points: coordinates of tesselation vertices
+    @type points: N x 3 np.array
+    @param tri: Delaunay tesselation of points
+    @type tri: scipy.spatial.Delaunay
+    @param alpha: alpha value, tetrahedra with circumradius < 1/alpha are retained
+    @type alpha: float
+    @return: 1.0 for tetrahedra in the alpha complex, 0.0 otherwise
+    @rtype: np.array
+    """
+
+    circum_r = circumradii(points, tri.simplices)
+
+    # Here's the radius filter.
+    classification = (circum_r < 1.0/alpha).astype(float)
 
     return(classification)
 
 
+def circumradii(points, simplices):
+    """
+    Circumsphere radii of tetrahedra as batched array operations
+
+    @param points: coordinates of tesselation vertices
+    @type points: N x 3 np.array
+    @param simplices: vertex indices of each tetrahedron
+    @type simplices: M x 4 np.array
+    @return: circumsphere radius of each tetrahedron (inf if degenerate)
+    @rtype: np.array
+    """
+
+    # Exact integer arithmetic for voxel coordinates
+    if np.issubdtype(points.dtype, np.integer):
+        p = points.astype(np.int64)[simplices]
+    else:
+        p = points.astype(float)[simplices]
+
+    # Edge vectors from first vertex
+    u = p[:, 1, :] - p[:, 0, :]
+    v = p[:, 2, :] - p[:, 0, :]
+    w = p[:, 3, :] - p[:, 0, :]
+
+    vxw = np.cross(v, w)
+    wxu = np.cross(w, u)
+    uxv = np.cross(u, v)
+
+    # Six times the signed volume
+    det = np.sum(u * vxw, axis=1)
+
+    # Circumcenter relative to first vertex = num / (2 det)
+    num = (np.sum(u * u, axis=1)[:, None] * vxw +
+           np.sum(v * v, axis=1)[:, None] * wxu +
+           np.sum(w * w, axis=1)[:, None] * uxv)
+
+    num_norm = np.sqrt(np.sum(num.astype(float) ** 2, axis=1))
+
+    circum_r = np.full(det.shape, np.inf)
+    ok = det != 0
+    circum_r[ok] = num_norm[ok] / (2.0 * np.abs(det[ok].astype(float)))
+
+    return circum_r
+
+
 def save_to_nifti(vol, bb, hdr_nii, out_fname):
     """
     Save vol to nifti-file
@@ -440,29 +462,48 @@ def save_to_nifti(vol, bb, hdr_nii, out_fname):
     @rtype: None
     """
     # Save interpolated label volume
-    tmp_vol = hdr_nii.get_data().copy()
+    tmp_vol = np.asanyarray(hdr_nii.dataobj).copy()
     tmp_vol = InsertSubVol(tmp_vol, vol, bb)
-    out_nii = nib.Nifti1Image(tmp_vol, hdr_nii.get_affine())
+    out_nii = nib.Nifti1Image(tmp_vol, hdr_nii.affine)
     out_nii.to_filename(out_fname)
 
 
-def SetValsPoints(points, vals, Lsub):
+def FindSimplices(tri, points, shape, chunk=262144):
     """
-    Construct a 3D array with vals at points
-    
-    @param points: coordinates at which to write values
-    @type points: list of tupels
-    @param vals: values to write at coordinates
-    @type vals: list
-    @param hdr_nii: nifti file with relevant header info
-    @type hdr_nii: nibabel nifti file object
-    @return: 3D np.array with vals at points
-    @rtype: np.array
+    Find the Delaunay tetrahedron containing each voxel of a volume
+
+    Only voxels inside the bounding box of the tesselation points can lie within
+    the convex hull, so only those are queried, in chunks to bound memory.
+
+    @param tri: Delaunay tesselation of points
+    @type tri: scipy.spatial.Delaunay
+    @param points: integer voxel coordinates of tesselation vertices
+    @type points: N x 3 np.array
+    @param shape: volume dimensions
+    @type shape: 3-Tupel
+    @param chunk: number of voxels queried at once
+    @type chunk: int
+    @return: tetrahedron index for each voxel, -1 outside the tesselation
+    @rtype: 3D np.array
     """
-    #print new_labels.shape
-    for i in range(len(vals)):
-        point = points[i,:]
-        Lsub[point[0], point[1], point[2]] = vals[i]
+    simplices_i = -np.ones(shape, dtype=np.int32)
+
+    # Bounding box of the convex hull
+    lo = points.min(axis=0)
+    hi = points.max(axis=0) + 1
+    dims = tuple(hi - lo)
+    n = int(np.prod(dims))
+
+    box_i = np.empty(n, dtype=np.int32)
+
+    for c0 in range(0, n, chunk):
+        idx = np.arange(c0, min(c0 + chunk, n))
+        xyz = np.column_stack(np.unravel_index(idx, dims)) + lo
+        box_i[c0:c0 + idx.size] = tri.find_simplex(xyz)
+
+    simplices_i[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = box_i.reshape(dims)
+
+    return simplices_i
 
 
 def smooth_labels(vol):
@@ -486,12 +527,109 @@ def smooth_labels(vol):
     vol = vol > 0.5
 
 
+def AlphaShapeInterpolate(Lsub, n_slices):
+    """
+    Alpha shape interpolation of a binary label subvolume
+
+    @param Lsub: binary label subvolume
+    @type Lsub: 3D np.array
+    @param n_slices: number of slices expected in each axis, 0 for automatic
+    @type n_slices: list
+    @return: interpolated label mask, slices, preprocessed sample point volume,
+        tetrahedron index volume and Delaunay tesselation
+    @rtype: tuple
+    """
+    # Detect slices in segmentaion image
+    slices = FindSlices(Lsub, n_slices)
+
+    # Reduce to segmentation within slices to contour lines to speed up processing
+    Lsub_contour = ReduceSlices2Contours(Lsub, slices)
+
+    # Calc median distance of slices
+    dist = EvalSliceDistance(slices)
+
+    # Set alpha so that it tetrahedrons between slices are not removed by alpha shape approach
+    alpha = 1.0/dist/2
+
+    # Fill contours with sample points for Delaunay tesselation
+    Lsub_sub = MakeSamplePoints(Lsub, slices, dist)
+
+    # Input to alpha shapes is the combination of contours and sample points
+    Lsub_pre = Lsub_contour + Lsub_sub
+    Lsub_pre = (Lsub_pre > 0.5).astype(int)
+
+    # get coordinates of segmentation labels
+    x,y,z = np.where(Lsub_pre > 0)
+    points = np.transpose(np.array((x,y,z)))
+    
+    # perform Delaunay tesselation
+    tri = Delaunay(points)
+
+    # Locate the tetrahedron containing each voxel of the subvolume
+    # Only voxels within the bounding box of the tesselation are queried
+    simplices_i = FindSimplices(tri, points, Lsub.shape)
+
+    # perform alpha shape 3 
+    v_class = alpha_shape(points, tri, alpha)
+
+    # Retain voxels in tetrahedra belonging to the alpha complex
+    in_alpha = simplices_i > -1
+    in_alpha[in_alpha] = v_class[simplices_i[in_alpha]] > 0
+
+    return in_alpha, slices, Lsub_pre, simplices_i, tri
+
+
+def InterpolateLabel(job):
+    """
+    Alpha shape interpolation of a single label within its bounding box
+
+    Runs in a worker process. Intermediate preprocessing and Delaunay results
+    are saved here, one file per label.
+
+    @param job: input filename, output stub, label number, label subvolume,
+        bounding box, slice counts and preproc, delaunay and smoothing flags
+    @type job: tuple
+    @return: label number, interpolated label subvolume, bounding box
+    @rtype: tuple
+    """
+    label_fname, out_stub, label, Lsub, bb, n_slices, save_preproc, save_delaunay, smooth = job
+
+    print('Interpolating label %d' % label)
+
+    in_alpha, slices, Lsub_pre, simplices_i, tri = AlphaShapeInterpolate(Lsub, n_slices)
+
+    print("  Label %d : number of slices, x: %s, y: %s, z: %s" % (label, slices[0][0].shape[0],slices[1][0].shape[0],slices[2][0].shape[0]))
+    print('  Label %d contains %d voxels' % (label, np.sum(Lsub_pre[:])))
+
+    if save_preproc:
+        out_fname = out_stub + '_preproc_%d.nii.gz' % label
+        print('  Saving result of preprocessing to %s' % out_fname)
+        save_to_nifti(Lsub_pre, bb, nib.load(label_fname), out_fname)
+
+    if save_delaunay:
+        out_fname = out_stub + '_delaunay_%d.nii.gz' % label
+        print('  Saving result of Delaunay tesselation to %s' % out_fname)
+        save_to_nifti(np.maximum(simplices_i, 0), bb, nib.load(label_fname), out_fname)
+
+    print("  Label %d : tetrahedra in Delaunay tesselation: %s" % (label, tri.simplices.shape[0]))
+    print("  Label %d : points contained in Delaunay tesselation: %s, in alpha complex: %s" % (label, np.sum(simplices_i > -1), np.sum(in_alpha)))
+
+    # create segmentation image of interpolation
+    Lsub = np.where(in_alpha, label, 0)
+
+    # smooth labels
+    if smooth:
+        smooth_labels(Lsub)
+
+    return label, Lsub, bb
+
+
 def main():
 
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Interpolate labels')
     parser.add_argument('-i','--input', required=True, help="Labeled volume")
-    parser.add_argument('-l','--labels', help="Label numbers to interpolate, separated by comma")
+    parser.add_argument('-l','--labels', help="Label numbers to interpolate, separated by comma [all labels]")
     parser.add_argument('-p', '--save-preproc', help="Save result of preprocessing", default=False, action='store_const', const=True, dest='save_preproc')
     parser.add_argument('-d', '--save-delaunay', help="Save result of Delaunay tesselation", default=False, action='store_const', const=True, dest='save_delaunay')
     parser.add_argument('-s', '--smooth-results', help="Smooth results of interpolation", default=False, action='store_const', const=True, dest='smooth_labels')
@@ -511,8 +649,8 @@ def main():
         for i in range(len(sink)):
             label_nos.append(int(sink[i]))
     else:
-        # Construct list of unique label values in image
-        label_nos = np.unique(args.labels)
+        # All labels in image
+        label_nos = []
 
     if args.slices:
         sink = args.slices
@@ -524,13 +662,6 @@ def main():
         # Construct list of unique label values in image
         n_slices = [0,0,0]
 
-    # loop over each unique label value
-    for label in label_nos:
-        
-        if label > 0:
-            
-            print('Interpolating label %d' % label)
-
     # Construct output filename    
     out_stub, out_ext = os.path.splitext(label_fname)
     if out_ext == '.gz':
@@ -538,99 +669,61 @@ def main():
     
     # Load labeled volume
     label_nii = nib.load(label_fname)
-    labels = label_nii.get_data()
-
-    # Size of image space
-    nx, ny, nz = labels.shape
+    labels = np.asanyarray(label_nii.dataobj)
 
     # Remember when we started processing input
     start_time = time.time()
 
-    # Extract current label
-    L = (labels == label).astype(float)
-
-    # Extract minimum subvolume containing label
-    Lsub, bb = ExtractMinVol(L)
-
-    # Detect slices in segmentaion image
-    slices = FindSlices(Lsub, n_slices)
-    print("Number of slices, x: %s, y: %s, z: %s" % (slices[0][0].shape[0],slices[1][0].shape[0],slices[2][0].shape[0]))
-
-    # Reduce to segmentation within slices to contour lines to speed up processing
-    Lsub_contour, contour = ReduceSlices2Contours(Lsub, slices)
-
-    # Calc median distance of slices
-    dist = EvalSliceDistance(slices)
-
-    # Set alpha so that it tetrahedrons between slices are not removed by alpha shape approach
-    alpha = 1.0/dist/2
-
-    # Fill contours with sample points for Delaunay tesselation
-    Lsub_sub = MakeSamplePoints(Lsub, slices, dist)
-
-    # Input to alpha shapes is the combination of contours and sample points
-    Lsub = Lsub_contour + Lsub_sub
-    Lsub = (Lsub > 0.5).astype(int)
+    # Integer label volume for bounding box detection
+    labels_int = np.rint(labels).astype(np.int32)
 
-    if args.save_preproc:
-        print('Saving result of preprocessing to %s' % (out_stub + '_preproc.nii.gz'))
-        save_to_nifti(Lsub, bb, label_nii, out_stub + '_preproc.nii.gz')
+    if not label_nos:
+        # Construct list of unique label values in image
+        label_nos = np.unique(labels_int)
 
-    print('  Label contains %d voxels' % np.sum(Lsub[:]))
+    # Unique positive labels in ascending order
+    label_nos = sorted(set(int(label) for label in label_nos if label > 0))
 
-    # get coordinates of segmentation labels
-    x,y,z = np.where(Lsub > 0)
-    points = np.transpose(np.array((x,y,z)))
-    
-    # perform Delaunay tesselation
-    tri = Delaunay(points)
+    if not label_nos:
+        print('* No labels to interpolate - exiting')
+        sys.exit(1)
 
-    # Construct interpolation mesh for volume
-    nx, ny, nz = Lsub.shape
-    xv, yv, zv = np.arange(0,nx), np.arange(0,ny), np.arange(0,nz)
-    xi, yi, zi = np.meshgrid(xv, yv, zv, indexing='ij')
-    xi, yi, zi = xi.reshape(-1,1), yi.reshape(-1,1), zi.reshape(-1,1)
-    
-    new_points = np.zeros((xi.shape[0], 3))
-    for i in range(xi.shape[0]):
-        new_points[i,:] = xi[i], yi[i], zi[i]
+    # Bounding boxes of all labels from a single pass through the volume
+    objects = find_objects(labels_int, max_label=label_nos[-1])
 
-    # determine for each point in which tetrahedron it is
-    simplices_i = tri.find_simplex(new_points)
+    # Crop each label to its minimum subvolume
+    jobs = []
+    for label in label_nos:
 
-    if args.save_delaunay:
-        vals = simplices_i.copy()
-        vals[vals == -1] = 0.0
-        Lsub_tmp = Lsub.copy()
-        SetValsPoints(new_points, vals, Lsub_tmp)
-        print('Saving result of Delaunay tesselation to %s' % (out_stub + '_delaunay.nii.gz'))
-        save_to_nifti(Lsub_tmp, bb, label_nii, out_stub + '_delaunay.nii.gz')
+        sl = objects[label - 1]
 
+        if sl is None:
+            print('* Label %d not found in %s - skipping' % (label, label_fname))
+            continue
 
-    # perform alpha shape 3 
-    print("Vertices in Delaunay tesselation: %s" % tri.vertices.shape[0])
-    v_class = alpha_shape(points, tri, alpha)
-    print("Vertices in Alpha Complex: %s" % np.sum(v_class))
+        bb = sl[0].start, sl[0].stop, sl[1].start, sl[1].stop, sl[2].start, sl[2].stop
+        Lsub = (labels_int[sl] == label).astype(float)
 
+        jobs.append((label_fname, out_stub, label, Lsub, bb, n_slices,
+                     args.save_preproc, args.save_delaunay, args.smooth_labels))
 
-    print("Points contained in Dalauny tesselation: %s" % len(np.where(simplices_i > -1)[0]))
-    for i in range(len(simplices_i)):
-        if simplices_i[i] > -1:
-            if v_class[simplices_i[i]] == 0:
-                simplices_i[i] = -1
-    print("Points contained in alpha complex: %s" % len(np.where(simplices_i > -1)[0]))
+    # Interpolate labels in parallel
+    n_workers = max(1, min(len(jobs), mp.cpu_count()-2))
+    print('Interpolating %d labels using %d processes' % (len(jobs), n_workers))
 
-    # create segmentation image of interpolation
-    vals = np.zeros_like(simplices_i)
-    vals[simplices_i > -1] = label
-    SetValsPoints(new_points, vals, Lsub)
+    with mp.Pool(n_workers) as pool:
+        results = pool.map(InterpolateLabel, jobs)
 
-    # smooth labels
-    if args.smooth_labels:
-        smooth_labels(Lsub)
+    # Merge interpolated labels into the original label volume
+    # Results are inserted in ascending label order, so where interpolations
+    # overlap the highest label number wins, independent of process scheduling
+    out_vol = labels.copy()
+    for label, Lsub, bb in results:
+        out_vol = InsertSubVol(out_vol, Lsub, bb)
 
     print('Saving result of interpolation to %s' % (out_stub + '_interp.nii.gz'))
-    save_to_nifti(Lsub, bb, label_nii, out_stub + '_interp.nii.gz')
+    out_nii = nib.Nifti1Image(out_vol, label_nii.affine)
+    out_nii.to_filename(out_stub + '_interp.nii.gz')
 
     print('Total Processing Time: %s s' % (time.time() - start_time))
 
@@ -6,6 +6,7 @@ Output volumes of each label in an atlas in microliters.
 Usage
 ----
 label_volumes.py <atlas_file>
+label_volumes.py -o <CSV file> <atlas_file> [<atlas_file> ...]
 label_volumes.py -h
 
 Example
@@ -45,7 +46,9 @@ Copyright
 __version__ = '0.1.0'
 
 import sys
+import csv
 import argparse
+import multiprocessing as mp
 import nibabel as nib
 import numpy as np
 
@@ -54,43 +57,102 @@ def main():
     
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Atlas label volumes in microliters')
-    parser.add_argument('atlas_file', help="source atlas labels filename")
+    parser.add_argument('atlas_files', nargs='+', help="source atlas labels filename(s)")
+    parser.add_argument('-o', '--output', help="CSV file for volumes of all atlases (file, label, voxels, ul)")
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help="Worker processes for multiple atlases, 0 for all available [0]")
 
     args = parser.parse_args()
 
-    atlas_file = args.atlas_file
-        
+    atlas_files = args.atlas_files
+
+    if len(atlas_files) > 1:
+        n_jobs = args.jobs if args.jobs > 0 else max(1, mp.cpu_count()-2)
+        with mp.Pool(min(n_jobs, len(atlas_files))) as pool:
+            results = pool.map(atlas_label_volumes, atlas_files)
+    else:
+        results = [atlas_label_volumes(atlas_files[0])]
+
+    if args.output or len(atlas_files) > 1:
+
+        # Tidy CSV with one row per label per atlas
+        if args.output:
+            fd = open(args.output, 'w', newline='')
+        else:
+            fd = sys.stdout
+
+        writer = csv.writer(fd)
+        writer.writerow(['file', 'label', 'voxels', 'ul'])
+        for atlas_file, labels, vol_vox, vol_ul in results:
+            for label, n, v in zip(labels, vol_vox, vol_ul):
+                writer.writerow([atlas_file, label, n, '%0.1f' % v])
+
+        if args.output:
+            fd.close()
+
+    else:
+
+        _, labels, vol_vox, vol_ul = results[0]
+
+        # Column headers
+        print('%6s %10s %10s' % ('Label', 'Voxels', 'ul'))
+
+        for label, n, v in zip(labels, vol_vox, vol_ul):
+            print('%6d %10d %10.1f' % (label, n, v))
+    
+    # Clean exit
+    sys.exit(0)
+
+
+def atlas_label_volumes(atlas_file):
+    """
+    Voxel counts and volumes of all labels in an atlas file
+
+    Parameters
+    ----------
+    atlas_file: atlas label image filename
+
+    Returns
+    -------
+    atlas_file, labels, vol_vox, vol_ul: filename, label numbers, voxel counts
+        and volumes in microliters of non-empty labels with index > 0
+    """
+
     # Load the source atlas image
     atlas_nii = nib.load(atlas_file)
-    atlas_labels = atlas_nii.get_data()
-    
+    atlas_labels = np.asanyarray(atlas_nii.dataobj)
+
     # Atlas voxel volume in mm^3 (microliters)
     atlas_vox_vol_ul = np.array(atlas_nii.header.get_zooms()).prod()
-    
-    # Create list of unique label values
-    labels = np.unique(atlas_labels)
 
-    # Column headers
-    print('%6s %10s %10s' % ('Label', 'Voxels', 'ul'))
-    
-    for label in labels:
-
-        # Skip label 0 (background)
-        if label > 0:
-
-            # Extract target label as a boolean mask        
-            label_mask = (atlas_labels == label)
-            
-            # Integrate volume of current label
-            label_vol_vox = np.sum(label_mask)
-            label_vol_ul = label_vol_vox * atlas_vox_vol_ul
-            
-            # Only output non-empty labels with index > 0
-            if label_vol_ul > 0.0:
-                print('%6d %10d %10.1f' % (label, label_vol_vox, label_vol_ul))
-    
-    # Clean exit
-    sys.exit(0)
+    labels, vol_vox = label_volumes(atlas_labels)
+
+    return atlas_file, labels, vol_vox, vol_vox * atlas_vox_vol_ul
+
+
+def label_volumes(atlas_labels):
+    """
+    Voxel counts of all positive labels from a single bincount pass
+
+    Parameters
+    ----------
+    atlas_labels: numpy integer label array
+
+    Returns
+    -------
+    labels, vol_vox: label numbers and voxel counts of non-empty labels > 0
+    """
+
+    # Skip label 0 (background) and negative labels
+    x = np.rint(atlas_labels.ravel()).astype(np.int64)
+    x = x[x > 0]
+
+    counts = np.bincount(x)
+
+    # Only non-empty labels
+    labels = np.flatnonzero(counts)
+
+    return labels, counts[labels]
 
 
 # This is the standard boilerplate that calls the main() function.
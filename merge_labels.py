@@ -47,6 +47,7 @@ import sys
 import argparse
 import nibabel as nib
 import numpy as np
+from nifti_io import iload_images
 
 
 def main():
@@ -62,26 +63,20 @@ def main():
     out_file = args.out_file
     in_files = args.in_files
     
-    # Load label image
-    print('Opening first input file to use as reference')
-    in_nii = nib.load(in_files[0])
-    out_labels = np.zeros_like(in_nii.get_data())
+    # Label images are decoded in parallel and returned in order
+    for i, (in_file, in_nii, src_labels) in enumerate(iload_images(in_files)):
 
-    for i in xrange(len(in_files)):
-        in_file = in_files[i]
+        # Use first input file as reference
+        if i == 0:
+            out_labels = np.zeros_like(src_labels)
 
-        # Load the source atlas image
         print('Processing %s' % in_file)
-        in_nii = nib.load(in_file)
-            
-        # Load label image
-        src_labels = in_nii.get_data()
         out_labels[np.where(src_labels)] = i + 1
 
 
     # Save smoothed labels image
     print('Saving merged labels to %s' % out_file)
-    out_nii = nib.Nifti1Image(out_labels, in_nii.get_affine())
+    out_nii = nib.Nifti1Image(out_labels, in_nii.affine)
     out_nii.to_filename(out_file)
 
     
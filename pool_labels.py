@@ -4,12 +4,18 @@ Pool/Combine one or more labels within an integer atlas volume
 
 Usage
 ----
-pool_labels.py <input label image> <output label image> <input label numbers> <output label number>
+pool_labels.py <input label image> <output label image> <output label number> <input label numbers>
+pool_labels.py -s <pooling specification> <input label image> <output label image>
 pool_labels.py -h
 
 Example
 ----
 >>> pool_labels.py atlas.nii.gz atlas_1.nii.gz 1 12 13 14
+>>> pool_labels.py -s coarse.txt atlas.nii.gz atlas_coarse.nii.gz
+
+where coarse.txt contains one rule per line, for example
+1: 12 13 14
+2: 3, 4
 
 Authors
 ----
@@ -57,16 +63,25 @@ def main():
     parser = argparse.ArgumentParser(description='Pool one or more atlas labels')
     parser.add_argument('in_file', help="source atlas labels filename")
     parser.add_argument('out_file', help="pooled atlas labels filename")
-    parser.add_argument('out_label', metavar='out_label', type=int, help='one label number to renumber in_labels to')
-    parser.add_argument('in_labels', metavar='in_label', type=int, nargs='+',
+    parser.add_argument('out_label', metavar='out_label', type=int, nargs='?', help='one label number to renumber in_labels to')
+    parser.add_argument('in_labels', metavar='in_label', type=int, nargs='*',
                         help='two label numbers to change')
+    parser.add_argument('-s', '--spec', help='pooling specification file with one "out_label: in_labels" rule per line')
 
     args = parser.parse_args()
 
     in_file = args.in_file
     out_file = args.out_file
-    in_labels = args.in_labels
-    out_label = args.out_label
+
+    # Pooling rules from specification file or command line
+    if args.spec:
+        print('Loading pooling specification from %s' % args.spec)
+        rules = load_pool_spec(args.spec)
+    elif args.out_label is not None and args.in_labels:
+        rules = [(args.out_label, args.in_labels)]
+    else:
+        print('* Provide an output label and input labels, or a pooling specification file')
+        sys.exit(1)
         
     # Load the source atlas image
     print('Opening %s' % in_file)
@@ -74,28 +89,30 @@ def main():
     
     # Load label image
     print('Loading labels')
-    src_labels = in_nii.get_data()
-        
+    src_labels = np.asanyarray(in_nii.dataobj)
+
+    # Construct label lookup table from all rules
+    try:
+        lut, lut_offset = pool_lut(rules, src_labels)
+    except ValueError as e:
+        print('* %s - exiting' % e)
+        sys.exit(1)
+
+    for out_label, in_labels in rules:
+        print('  %s -> %d' % (' '.join(str(label) for label in in_labels), out_label))
+
+    # Widen the output type if a pooled label does not fit the source type
+    out_dtype = np.result_type(src_labels.dtype, np.min_scalar_type(lut.min()), np.min_scalar_type(lut.max()))
+    if out_dtype != src_labels.dtype:
+        print('  Saving labels as %s to hold all pooled labels' % out_dtype)
+
+    # Pool desired labels and copy all other labels in one pass
     print('Pooling desired labels')
-    out_labels = np.zeros_like(src_labels)
-    for label in in_labels:
-        # Extract target label as a boolean mask
-        out_labels += (src_labels == label)
-
-    # Renumber target label region
-    out_labels *= out_label
-  
-    print('Copying all other labels from original')
-    for label in np.unique(src_labels):
-        if (label in in_labels) or label == out_label or label == 0:
-            continue
-        else:
-            ind = np.where(src_labels == label)
-            out_labels[ind] = label
+    out_labels = lut[np.rint(src_labels).astype(np.int64) - lut_offset].astype(out_dtype)
     
     # Save changed labels image
     print('Saving changed labels to %s' % out_file)
-    out_nii = nib.Nifti1Image(out_labels, in_nii.get_affine())
+    out_nii = nib.Nifti1Image(out_labels, in_nii.affine)
     out_nii.to_filename(out_file)
     
     print('Done')
@@ -104,6 +121,96 @@ def main():
     sys.exit(0)
 
 
+def load_pool_spec(spec_file):
+    """
+    Load pooling rules from a text file
+
+    Each line contains one rule of the form "out_label: in_label in_label ...",
+    with input labels separated by spaces or commas. Text after # is ignored.
+    Output labels of one rule may be pooled again by another rule, so that a
+    label hierarchy can be collapsed in a single pass.
+
+    Parameters
+    ----------
+    spec_file: pooling specification filename
+
+    Returns
+    -------
+    rules: list of (out_label, in_labels) tuples
+    """
+
+    rules = []
+
+    with open(spec_file, 'r') as f:
+        for line in f:
+
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+
+            try:
+                out_str, in_str = line.split(':')
+                out_label = int(out_str)
+                in_labels = [int(x) for x in in_str.replace(',', ' ').split()]
+            except ValueError:
+                print('* Could not parse pooling rule "%s" - exiting' % line)
+                sys.exit(1)
+
+            rules.append((out_label, in_labels))
+
+    if not rules:
+        print('* No pooling rules found in %s - exiting' % spec_file)
+        sys.exit(1)
+
+    return rules
+
+
+def pool_lut(rules, src_labels):
+    """
+    Lookup table implementing all pooling rules at once
+
+    Labels not pooled by any rule map to themselves. Rules are chained, so
+    an input label pooled into an output label that is itself pooled by a
+    further rule maps directly to the final label.
+
+    Parameters
+    ----------
+    rules: list of (out_label, in_labels) tuples
+    src_labels: numpy label array
+
+    Returns
+    -------
+    lut, lut_offset: lookup table and index of label 0 offset, such that the
+        new value of label l is lut[l - lut_offset]
+    """
+
+    all_labels = [l for out_label, in_labels in rules for l in [out_label] + list(in_labels)]
+    lo = int(min(np.min(src_labels), min(all_labels), 0))
+    hi = int(max(np.max(src_labels), max(all_labels)))
+
+    lut_offset = lo
+    lut = np.arange(lo, hi + 1, dtype=np.int64)
+
+    pooled = {}
+    for out_label, in_labels in rules:
+        for label in in_labels:
+            if label in pooled and pooled[label] != out_label:
+                raise ValueError('Label %d pooled into both %d and %d' % (label, pooled[label], out_label))
+            pooled[label] = out_label
+
+    # Follow chains of rules to their final label
+    for label in pooled:
+        final, seen = label, {label}
+        while final in pooled and pooled[final] != final:
+            final = pooled[final]
+            if final in seen:
+                raise ValueError('Pooling rules for label %d contain a cycle' % label)
+            seen.add(final)
+        lut[label - lut_offset] = final
+
+    return lut, lut_offset
+
+
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
     main()
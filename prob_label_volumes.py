@@ -5,7 +5,7 @@ Accepts multiple 4D prob atlas files
 
 Usage
 ----
-prob_label_volumes.py <atlas_file>
+prob_label_volumes.py <atlas_file> [<atlas_file> ...]
 prob_label_volumes.py -h
 
 Example
@@ -47,8 +47,10 @@ __version__ = '0.1.0'
 import os
 import sys
 import argparse
+import multiprocessing as mp
 import nibabel as nib
 import numpy as np
+from nifti_io import decoded_dtype
 
 
 def main():
@@ -56,46 +58,89 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Probabilistic label volumes in microliters')
     parser.add_argument('prob_files', type=str, nargs='+', help="List of 4D prob label images")
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help="Worker processes, 0 for all available [0]")
+    parser.add_argument('-s', '--slab-mb', type=float, default=64.0,
+                        help="Maximum size of image slab read at once in MB [64]")
 
     # Parse command line arguments
     args = parser.parse_args()
-    prob_files = args.prob_files
-    
-    for p_file in prob_files:
-        
-        # Force absolute path
-        p_file = os.path.abspath(p_file)
-        
-        # Load the source atlas image
-        p_nii = nib.load(p_file)
-        p = p_nii.get_data()
-        nd = p.ndim
-        
-        # Atlas voxel volume in mm^3 (microliters)
-        atlas_vox_vol_ul = np.array(p_nii.header.get_zooms()).prod()
-        
-        # Treat probabilities as partial volumes and integrate
-        if nd == 3:
-
-            V = np.sum(p) * atlas_vox_vol_ul
-            print('%0.3f' % V) 
-
-        elif nd == 4:
-
-            nx,ny,nz,nt = p.shape
-
-            for t in range(0,nt):
-
-                V = np.sum(p[:,:,:,t]) * atlas_vox_vol_ul
-                print('%0.3f' % V),
-
-            # Final newline
-            print          
+
+    # Force absolute paths
+    prob_files = [os.path.abspath(p_file) for p_file in args.prob_files]
+
+    jobs = [(p_file, args.slab_mb) for p_file in prob_files]
+
+    n_jobs = args.jobs if args.jobs > 0 else max(1, mp.cpu_count()-2)
+    n_jobs = min(n_jobs, len(jobs))
+
+    if n_jobs > 1:
+        with mp.Pool(n_jobs) as pool:
+            results = pool.map(prob_label_volumes, jobs)
+    else:
+        results = [prob_label_volumes(job) for job in jobs]
+
+    # One row of label volumes per file
+    for V in results:
+        print(' '.join('%0.3f' % v for v in V))
     
     # Clean exit
     sys.exit(0)
 
 
+def prob_label_volumes(job):
+    """
+    Integrate probabilistic label volumes in microliters, one slab at a time
+
+    Slabs of consecutive slices are read through the nibabel array proxy in
+    file order, so only one slab is held in memory at once and compressed
+    images are decompressed in a single forward pass.
+
+    Parameters
+    ----------
+    job: tuple
+        3D or 4D probabilistic label image filename, maximum slab size in MB
+
+    Returns
+    -------
+    V: numpy float64 array
+        Volume of each label (4th dimension) in microliters
+    """
+
+    p_file, slab_mb = job
+
+    # Image header and array proxy only - no data loaded yet
+    # The file stays open between slab reads, so a compressed image is
+    # decompressed once rather than from the start for every slab
+    p_nii = nib.load(p_file, keep_file_open=True)
+    p = p_nii.dataobj
+    nd = len(p.shape)
+
+    # Atlas voxel volume in mm^3 (microliters)
+    atlas_vox_vol_ul = np.array(p_nii.header.get_zooms()[0:3]).prod()
+
+    nx, ny, nz = p.shape[0:3]
+    nt = p.shape[3] if nd == 4 else 1
+
+    # Slices per slab within the memory budget, using the data type
+    # returned by the proxy after any intensity scaling
+    slice_bytes = nx * ny * decoded_dtype(p_nii).itemsize
+    dz = int(max(1, min(nz, slab_mb * 1024 * 1024 // slice_bytes)))
+
+    # Treat probabilities as partial volumes and integrate
+    V = np.zeros(nt, dtype=np.float64)
+
+    for t in range(nt):
+        for z0 in range(0, nz, dz):
+            if nd == 4:
+                slab = p[:, :, z0:z0+dz, t]
+            else:
+                slab = p[:, :, z0:z0+dz]
+            V[t] += np.sum(slab, dtype=np.float64)
+
+    return V * atlas_vox_vol_ul
+
+
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
     main()
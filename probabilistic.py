@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 """
-Construct a probabilistic atlas from a set of N label images each containing
-M unique labels. The final atlas will be a 4D float image (nx x ny x nz x M)
+Construct a probabilistic atlas from a set of N label images containing a total
+of M unique labels. The final atlas will be a 4D float image (nx x ny x nz x M)
 scaled from 0.0 to 1.0
 
 Usage
 ----
-probabilistic.py -o <Output filename> <List of N label image volumes>
+probabilistic.py -o <Output filename> [-j <jobs>] <List of N label image volumes>
 probabilistic.py -h
 
 Example
@@ -49,6 +49,8 @@ import sys
 import argparse
 import nibabel as nib
 import numpy as np
+import multiprocessing as mp
+from nifti_io import iload_images
 
 
 def main():
@@ -56,6 +58,8 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Construct probabilistic atlas from label volumes')
     parser.add_argument('-o', '--output', help='Output atlas filename')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Worker processes for parallel map-reduce build, 0 for all available [1]')
     parser.add_argument('label_files', nargs='+', help='Space-separated list of label filenames')
 
     # Parse command line arguments
@@ -70,51 +74,46 @@ def main():
     
     # Count number of label files
     N = len(label_files)
-    
-    for i, fname in enumerate(label_files):
-        
-        print('  Adding label volume ' + fname)
-        
-        # Open current label volume
-        label_nii = nib.load(fname)
-
-        # Get data from current label volume
-        labels = label_nii.get_data()
-
-        # Init from first volume       
-        if i < 1:
-            
-            print('  Initializing probabilistic atlas')
-
-            # Construct list of unique label values in first volume
-            # NOTE: should be identical list for all volumes
-            unique_labels = np.unique(labels)
-            
-            # Remove background label (0) from list
-            unique_labels = np.delete(unique_labels, np.where(unique_labels == 0))
-            
-            # Count number of labels
-            M = len(unique_labels)
-            
-            print('  Identified %d unique labels' % M)
-            
-            # Make space for final 4D prob atlas
-            nx,ny,nz = label_nii.header.get_data_shape()
-            prob = np.zeros((nx,ny,nz,M), dtype='float32')
-            
-            # Grab affine transform from first label volume
-            T = label_nii.get_affine()
-    
-        # loop over each unique label value
-        for m, label in enumerate(unique_labels):
-            
-            # Create mask for current label
-            label_mask = (labels == label)
-                
-            # Add mask to 4D
-            prob[:,:,:,m] += label_mask
-    
+
+    # Grab dimensions and affine transform from first label volume
+    print('  Initializing probabilistic atlas')
+    first_nii = nib.load(label_files[0])
+    shape = first_nii.header.get_data_shape()
+    T = first_nii.affine
+
+    n_jobs = args.jobs if args.jobs > 0 else max(1, mp.cpu_count()-2)
+    n_jobs = min(n_jobs, N)
+
+    try:
+
+        if n_jobs > 1:
+
+            # Workers count labels in contiguous subsets of files
+            # Partial counts are summed in place as each worker finishes,
+            # so only one partial is held in addition to the total
+            print('  Counting labels using %d processes' % n_jobs)
+            label_nos, counts = None, None
+            with mp.Pool(n_jobs) as pool:
+                jobs = [(list(fnames), shape, N) for fnames in np.array_split(label_files, n_jobs)]
+                for part in pool.imap_unordered(build_counts, jobs):
+                    if counts is None:
+                        label_nos, counts = part
+                    else:
+                        label_nos, counts = merge_counts(label_nos, counts, *part)
+                    del part
+
+        else:
+
+            label_nos, counts = build_counts((label_files, shape, N))
+
+    except ValueError as e:
+        print('* %s - exiting' % e)
+        sys.exit(1)
+
+    print('  Identified %d unique labels' % len(label_nos))
+
     # Normalize probabilities to [0,1]
+    prob = counts.astype('float32')
     prob /= float(N)
     
     # Write 4D probabilistic atlas
@@ -126,6 +125,133 @@ def main():
     sys.exit(0)
 
 
+def build_counts(job):
+    """
+    Count labels at each voxel over a list of label volumes
+
+    Parameters
+    ----------
+    job: tuple
+        label filenames, expected volume dimensions and total number of volumes
+        in the atlas (sets the count data type)
+
+    Returns
+    -------
+    label_nos, counts: sorted label numbers and nx x ny x nz x M label counts
+    """
+
+    fnames, shape, n_total = job
+
+    # Labels are gathered over all volumes as they are encountered
+    label_nos = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(tuple(shape) + (0,), dtype=count_dtype(n_total))
+
+    # Label volumes are decoded in parallel and returned in order
+    for fname, label_nii, labels in iload_images(fnames):
+
+        print('  Adding label volume ' + fname)
+
+        if labels.shape != counts.shape[0:3]:
+            raise ValueError('%s does not match dimensions of first label volume' % fname)
+
+        counts, label_nos = add_label_counts(counts, label_nos, labels)
+
+    return label_nos, counts
+
+
+def merge_counts(label_nos, counts, part_nos, part_counts):
+    """
+    Add partial label counts to a running total over the union of their labels
+
+    Counts are added in place unless the partial counts contain new labels.
+    Integer addition is exact, so the order in which partials are merged does
+    not affect the result.
+
+    Parameters
+    ----------
+    label_nos, counts: running total label numbers and counts
+    part_nos, part_counts: partial label numbers and counts
+
+    Returns
+    -------
+    label_nos, counts: merged label numbers and counts
+    """
+
+    if np.setdiff1d(part_nos, label_nos).size > 0:
+        new_label_nos = np.union1d(label_nos, part_nos)
+        counts = expand_counts(counts, label_nos, new_label_nos)
+        label_nos = new_label_nos
+
+    # Column by column to avoid a temporary copy of the whole count array
+    for j, col in enumerate(np.searchsorted(label_nos, part_nos)):
+        counts[..., col] += part_counts[..., j]
+
+    return label_nos, counts
+
+
+def count_dtype(n):
+    """
+    Smallest unsigned integer type able to count n label volumes
+    """
+
+    return np.uint16 if n <= np.iinfo(np.uint16).max else np.uint32
+
+
+def add_label_counts(counts, label_nos, labels):
+    """
+    Add one label volume to the 4D label counts with a single scatter-add
+
+    Parameters
+    ----------
+    counts: 4D numpy unsigned integer array
+        nx x ny x nz x M counts of each label
+    label_nos: numpy integer array
+        Sorted label numbers of the M count volumes
+    labels: 3D numpy array
+        Label volume to add
+
+    Returns
+    -------
+    counts, label_nos: updated counts and label numbers, extended if labels
+        contains labels not seen before
+    """
+
+    # Non-zero voxels of the label volume
+    labels = np.rint(labels.ravel()).astype(np.int64)
+    vox = np.flatnonzero(labels)
+    vals = labels[vox]
+
+    if vals.size < 1:
+        return counts, label_nos
+
+    # Labels present in this volume from a histogram over the label range
+    vmin = vals.min()
+    present = np.flatnonzero(np.bincount(vals - vmin)) + vmin
+
+    # Make room for labels not seen in previous volumes
+    if np.setdiff1d(present, label_nos).size > 0:
+        new_label_nos = np.union1d(label_nos, present)
+        counts = expand_counts(counts, label_nos, new_label_nos)
+        label_nos = new_label_nos
+
+    # Each voxel occurs once per volume, so a buffered fancy-index add is exact
+    M = len(label_nos)
+    counts.reshape(-1)[vox * M + np.searchsorted(label_nos, vals)] += 1
+
+    return counts, label_nos
+
+
+def expand_counts(counts, label_nos, new_label_nos):
+    """
+    Rearrange 4D label counts onto a larger sorted set of label numbers
+    """
+
+    new_counts = np.zeros(counts.shape[0:3] + (len(new_label_nos),), dtype=counts.dtype)
+    new_counts[..., np.searchsorted(new_label_nos, label_nos)] = counts
+
+    return new_counts
+
+
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
     main()
@@ -48,6 +48,7 @@ import argparse
 import nibabel as nib
 import numpy as np
 import pandas as pd
+from nifti_io import iload_images
 
 
 def main():
@@ -114,35 +115,74 @@ def main():
         sys.exit(1)
             
     print('\nFound %d mappings between old and new keys' % count)
-    
-    # Loop over all label volumes provided
-    for old_fname in label_fnames:
-        
-        # Construct output filename    
+
+    # Dense lookup table from old to new label index
+    lut, lut_offset = MakeLUT(i_old[:count], i_new[:count])
+
+    # Smallest integer type holding all new label indices
+    new_dtype = CompactDtype(lut)
+
+    # Label volumes are decoded in parallel and remapped in order
+    for old_fname, old_nii, old_labels in iload_images(label_fnames):
+
+        # Construct output filename
         old_stub, old_ext = os.path.splitext(old_fname)
         if old_ext == '.gz':
             old_stub, _ = os.path.splitext(old_stub)
-        new_fname = old_stub + '_remapped.nii.gz'         
-        
+        new_fname = old_stub + '_remapped.nii.gz'
+
         print('Remapping %s to %s' % (old_fname, new_fname))
-            
-        # Load old label image
-        old_nii = nib.load(old_fname)
-        old_labels = old_nii.get_data()
-        T = old_nii.get_affine()
 
-        # Create zeroed new label image        
-        new_labels = np.zeros_like(old_labels)
-        
-        # Loop over all old label indices
-        for i, old_idx in enumerate(i_old):
-            new_idx = i_new[i]
-            new_labels[old_labels == old_idx] = new_idx
-    
-        new_nii = nib.Nifti1Image(new_labels, T)
+        new_labels = RemapLabels(old_labels, lut, lut_offset, new_dtype)
+
+        new_nii = nib.Nifti1Image(new_labels, old_nii.affine)
         new_nii.to_filename(new_fname)
    
     print('Done')
+
+
+def MakeLUT(i_old, i_new):
+    '''
+    Dense lookup table from old to new label index
+    Old indices outside the key map to 0
+    '''
+
+    i_old = np.rint(i_old).astype(np.int64)
+    i_new = np.rint(i_new).astype(np.int64)
+
+    # Offset allows for negative old indices
+    lut_offset = min(0, i_old.min()) if i_old.size > 0 else 0
+    lut = np.zeros(i_old.max() - lut_offset + 1 if i_old.size > 0 else 1, dtype=np.int64)
+    lut[i_old - lut_offset] = i_new
+
+    return lut, lut_offset
+
+
+def CompactDtype(lut):
+    '''
+    Smallest integer data type holding all values in a lookup table
+    '''
+
+    if lut.min() >= 0:
+        return np.min_scalar_type(lut.max())
+
+    return np.result_type(np.min_scalar_type(lut.min()), np.min_scalar_type(lut.max()))
+
+
+def RemapLabels(old_labels, lut, lut_offset, new_dtype):
+    '''
+    Remap a label volume with a single lookup table gather
+    '''
+
+    # LUT indices of old labels, with labels outside the table mapped to 0
+    lut_idx = np.rint(old_labels).astype(np.int64) - lut_offset
+    outside = (lut_idx < 0) | (lut_idx >= lut.size)
+    lut_idx[outside] = 0
+
+    new_labels = lut.astype(new_dtype)[lut_idx]
+    new_labels[outside] = 0
+
+    return new_labels
     
 
 def LoadKey(key_fname):
@@ -151,12 +191,12 @@ def LoadKey(key_fname):
     '''
     
     # Import key as a data table
-    # Note the partially undocumented delim_whitespace flag
+    # Whitespace-delimited columns
     data = pd.read_table(key_fname,
                          comment='#',
                          header=None,
                          names=['Index','R','G','B','A','Vis','Mesh','Name'],
-                         delim_whitespace=True)
+                         sep=r'\s+')
     
     return data
 
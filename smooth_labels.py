@@ -46,7 +46,10 @@ __version__ = '0.1.0'
 
 import sys
 import argparse
+import multiprocessing as mp
+import numpy as np
 from scipy.ndimage.filters import gaussian_filter
+from scipy.ndimage import find_objects
 import nibabel as nib
 
 
@@ -56,6 +59,7 @@ def main():
     parser = argparse.ArgumentParser(description='Smooth one or more atlas labels')
     parser.add_argument('-i','--in_file', help="source atlas labels filename")
     parser.add_argument('-o','--out_file', help="smoothed atlas labels filename")
+    parser.add_argument('-s','--sigma', type=float, default=1.0, help="Gaussian smoothing sigma in voxels [1.0]")
     parser.add_argument('labels', metavar='label', type=int, nargs='+',
                         help='label numbers to smooth')
 
@@ -64,6 +68,7 @@ def main():
     in_file = args.in_file
     out_file = args.out_file
     labels = args.labels
+    sigma = args.sigma
         
     # Load the source atlas image
     print('Opening %s' % in_file)
@@ -71,35 +76,45 @@ def main():
     
     # Load label image
     print('Loading labels')
-    src_labels = in_nii.get_data()
+    src_labels = np.asanyarray(in_nii.dataobj)
     
     # Duplicate into output image
     print('Creating new label image')
     out_labels = src_labels.copy()
-    
+
+    # Bounding boxes of all labels from a single pass through the volume
+    objects = find_objects(np.rint(src_labels).astype(np.int32), max_label=max(labels))
+
+    # Crop each label to its bounding box plus the Gaussian kernel radius
+    # Smoothing within the crop then matches smoothing the full volume
+    margin = int(4.0 * sigma + 0.5) + 1
+    jobs = []
     for label in labels:
-        
-        print('  Smoothing label %d' % label)
-    
+
+        if label < 1 or objects[label - 1] is None:
+            print('  Label %d not found - skipping' % label)
+            continue
+
+        box = tuple(slice(max(0, sl.start - margin), min(n, sl.stop + margin))
+                    for sl, n in zip(objects[label - 1], src_labels.shape))
+
         # Extract target label as a boolean mask
-        print('  Identifying target label region %d' % label)
-        label_mask = (src_labels == label)
-    
-        # Smooth target label region
-        print('  Gaussian smoothing original target label')
-        label_mask_smooth = gaussian_filter(label_mask.astype(float), sigma=1.0)
-    
-        # Normalize smoothed intensities
-        label_mask_smooth = label_mask_smooth / label_mask_smooth.max()
-    
-        # Threshold smoothed mask at 0.5 to create new boolean mask
-        print('  Thresholding smoothed label')
-        label_mask_smooth = label_mask_smooth > 0.5
-    
-        # Replace unsmoothed with smoothed label, overwriting other labels
-        print('  Inserting smoothed target label')
-        out_labels[label_mask] = 0
-        out_labels[label_mask_smooth] = label
+        jobs.append((label, box, src_labels[box] == label, sigma))
+
+    # Smooth labels in parallel
+    n_workers = max(1, min(len(jobs), mp.cpu_count()-2))
+    print('Smoothing %d labels using %d processes' % (len(jobs), n_workers))
+
+    with mp.Pool(n_workers) as pool:
+        results = pool.map(smooth_label, jobs)
+
+    # Replace unsmoothed with smoothed labels, overwriting other labels
+    # Labels are inserted in the order given, so later labels take precedence
+    print('Inserting smoothed labels')
+    for (label, box, label_mask, _), label_mask_smooth in zip(jobs, results):
+        out_box = out_labels[box]
+        out_box[label_mask] = 0
+        out_box[label_mask_smooth] = label
     
     # Save smoothed labels image
     print('Saving smoothed labels to %s' % out_file)
@@ -112,6 +127,34 @@ def main():
     sys.exit(0)
 
 
+def smooth_label(job):
+    """
+    Gaussian smooth and threshold a cropped label mask
+
+    Parameters
+    ----------
+    job: tuple
+        label number, bounding box, boolean label mask within box, sigma in voxels
+
+    Returns
+    -------
+    label_mask_smooth: boolean mask of smoothed label within box
+    """
+
+    label, box, label_mask, sigma = job
+
+    print('  Smoothing label %d' % label)
+
+    # Smooth target label region
+    label_mask_smooth = gaussian_filter(label_mask.astype(np.float32), sigma=sigma)
+
+    # Normalize smoothed intensities
+    label_mask_smooth = label_mask_smooth / label_mask_smooth.max()
+
+    # Threshold smoothed mask at 0.5 to create new boolean mask
+    return label_mask_smooth > 0.5
+
+
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
     main()